@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import tokenize
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        terms = set(tokenize(search_term))
+        if not terms:
+            return queryset, False
+        for term in terms:
+            queryset = queryset.filter(search_terms__term=term)
+        return queryset, False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
@@ -0,0 +1,342 @@
+import datetime
+import json
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from yatube.routers import pin_to_primary, read_from_replica
+from yatube.sqlite import serialized_write
+
+from . import caching, follow_graph
+from .caching import conditional_feed
+from .counters import bump_post, group_summaries
+from .feeds import feed_posts
+from .forms import CommentForm
+from .models import Comment, Group, Post, User
+from .paginator import (COMMENT_ORDERING, COMMENTS_PER_PAGE, FEED_ORDERING,
+                        paginate)
+from .timeline import timeline_sources
+from .views import (group_feeds, group_index_feeds, group_page, index_feeds,
+                    profile_feeds)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Public name of a field and the lookup it is read with by values().
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Compact JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                      default=_default).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status,
+                        content_type='application/json')
+
+
+def error(message, status, **extra):
+    return json_response({'error': message, **extra}, status=status)
+
+
+def requested_fields(request, available):
+    """Fields listed in ?fields=, all of them by default, None if unknown
+    fields are asked for."""
+    names = [name for name in request.GET.get('fields', '').split(',')
+             if name]
+    if not names:
+        return list(available)
+    if not set(names) <= set(available):
+        return None
+    return names
+
+
+def serialize(rows, fields, available):
+    items = []
+    for row in rows:
+        item = {field: row[available[field]] for field in fields}
+        if 'image' in item:
+            item['image'] = (default_storage.url(item['image'])
+                             if item['image'] else None)
+        items.append(item)
+    return items
+
+
+def paginated(request, rows, fields, available, ordering=FEED_ORDERING,
+              **kwargs):
+    """A page of rows read with values(), without model instances."""
+    lookups = {available[field] for field in fields}
+    # The cursor is made of the ordering fields, fetch them anyway.
+    lookups.update(name.lstrip('-') for name in ordering)
+    page = paginate(request, rows.values(*lookups), ordering=ordering,
+                    **kwargs)
+    return {
+        'results': serialize(page, fields, available),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def feed_response(request, posts, **kwargs):
+    fields = requested_fields(request, POST_FIELDS)
+    if fields is None:
+        return error('Неизвестное поле.', 400, fields=list(POST_FIELDS))
+    return json_response(paginated(request, posts, fields, POST_FIELDS,
+                                   **kwargs))
+
+
+def api_login_required(view):
+    """login_required for the API: 401 instead of a redirect."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error('Требуется авторизация.', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _validate(items):
+    """Return the valid comments or the errors by position."""
+    if not isinstance(items, list) or not items:
+        return None, {'comments': ['Нужен непустой список комментариев.']}
+    if len(items) > settings.COMMENT_BATCH_SIZE:
+        return None, {'comments': [
+            f'Не больше {settings.COMMENT_BATCH_SIZE} комментариев.']}
+    # bool is an int too, and lists are not hashable.
+    post_ids = {item.get('post') for item in items
+                if isinstance(item, dict) and type(item.get('post')) is int}
+    existing = set(Post.objects.filter(
+        pk__in=post_ids).values_list('pk', flat=True))
+    comments, errors = [], {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'__all__': ['Ожидается объект.']}
+            continue
+        text = item.get('text')
+        form = CommentForm({'text': text})
+        item_errors = {field: list(messages)
+                       for field, messages in form.errors.items()}
+        # The form would take str() of a number or a list.
+        if text is not None and not isinstance(text, str):
+            item_errors['text'] = ['Ожидается строка.']
+        post_id = item.get('post')
+        if type(post_id) is not int:
+            item_errors['post'] = ['Ожидается идентификатор записи.']
+        elif post_id not in existing:
+            item_errors['post'] = ['Запись не найдена.']
+        if item_errors:
+            errors[index] = item_errors
+            continue
+        comment = form.save(commit=False)
+        comment.post_id = item['post']
+        comments.append(comment)
+    return comments, errors
+
+
+@transaction.atomic
+def _save_comments(comments, per_post):
+    # bulk_create() sends no signals: counters are updated here and
+    # caches by add_comments(), once per post instead of once per comment.
+    Comment.objects.bulk_create(comments)
+    for post_id, count in per_post.items():
+        bump_post(post_id, count)
+
+
+@require_POST
+@api_login_required
+@pin_to_primary
+def add_comments(request):
+    """Add a batch of comments at once, all or none of them.
+
+    Expects {"comments": [{"post": <id>, "text": "..."}, ...]}.
+    """
+    try:
+        items = json.loads(request.body).get('comments')
+    except (ValueError, AttributeError):
+        return error('Некорректный JSON.', 400)
+    comments, errors = _validate(items)
+    if errors:
+        return error('Комментарии не прошли проверку.', 400, errors=errors)
+    for comment in comments:
+        comment.author = request.user
+    per_post = Counter(comment.post_id for comment in comments)
+    serialized_write(_save_comments, comments, per_post)
+    feeds = [caching.post_version(pk) for pk in per_post]
+    for post in Post.objects.filter(pk__in=per_post).values(
+            'author_id', 'group_id'):
+        feeds.extend(caching.post_feeds(post['author_id'], post['group_id']))
+    caching.bump(*feeds)
+    return json_response({'created': len(comments)}, status=201)
+
+
+def _author_ids(data, name):
+    ids = data.get(name, [])
+    # bool is an int too.
+    if (not isinstance(ids, list)
+            or not all(type(pk) is int for pk in ids)):
+        return None
+    return ids
+
+
+def _change_follows(user, follow, unfollow):
+    return (follow_graph.follow_many(user, follow),
+            follow_graph.unfollow_many(user, unfollow))
+
+
+@require_POST
+@api_login_required
+@pin_to_primary
+def follow_authors(request):
+    """Follow and unfollow many authors at once.
+
+    Expects {"follow": [<user id>, ...], "unfollow": [<user id>, ...]}.
+    """
+    try:
+        data = json.loads(request.body)
+        follow = _author_ids(data, 'follow')
+        unfollow = _author_ids(data, 'unfollow')
+    except (ValueError, AttributeError):
+        return error('Некорректный JSON.', 400)
+    if follow is None or unfollow is None:
+        return error('Нужны списки идентификаторов авторов.', 400)
+    if len(follow) + len(unfollow) > settings.FOLLOW_BATCH_SIZE:
+        return error(f'Не больше {settings.FOLLOW_BATCH_SIZE} авторов.', 400)
+    followed, unfollowed = serialized_write(
+        _change_follows, request.user, follow, unfollow)
+    return json_response({'followed': sorted(followed),
+                          'unfollowed': sorted(unfollowed)})
+
+
+@require_GET
+@api_login_required
+@read_from_replica
+def follow_suggestions(request):
+    """Authors followed by the authors the user follows."""
+    scores = follow_graph.suggestions(request.user)
+    names = dict(User.objects.filter(
+        pk__in=[pk for pk, _ in scores]).values_list('pk', 'username'))
+    return json_response({'results': [
+        {'id': pk, 'username': names[pk], 'followed_by': count}
+        for pk, count in scores if pk in names
+    ]})
+
+
+def post_detail_feeds(post_id):
+    authors = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True)[:1]
+    if not authors:
+        return None
+    return [caching.post_version(post_id), f'profile:{authors[0]}']
+
+
+@require_GET
+@read_from_replica
+@conditional_feed(index_feeds)
+def posts(request):
+    return feed_response(request, feed_posts())
+
+
+@require_GET
+@read_from_replica
+@conditional_feed(group_index_feeds)
+def groups(request):
+    """Groups with their number of posts, last post date and top
+    authors, paged by ?cursor=."""
+    page = group_page(request)
+    return json_response({
+        'results': [
+            {
+                'slug': item['group'].slug,
+                'title': item['group'].title,
+                'posts_count': item['posts_count'],
+                'last_post_at': item['last_post_at'],
+                'top_authors': item['top_authors'],
+            }
+            for item in group_summaries(page)
+        ],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_GET
+@read_from_replica
+@conditional_feed(group_feeds)
+def group_posts(request, slug):
+    groups = Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    if not groups:
+        return error('Группа не найдена.', 404)
+    return feed_response(request, feed_posts(group_id=groups[0]))
+
+
+@require_GET
+@read_from_replica
+@conditional_feed(profile_feeds)
+def profile_posts(request, username):
+    users = User.objects.filter(
+        username=username).values_list('pk', flat=True)
+    if not users:
+        return error('Пользователь не найден.', 404)
+    return feed_response(request, feed_posts(author_id=users[0]))
+
+
+@require_GET
+@api_login_required
+@read_from_replica
+def follow_posts(request):
+    return feed_response(request, feed_posts(),
+                         sources=timeline_sources(request.user))
+
+
+@require_GET
+@read_from_replica
+@conditional_feed(post_detail_feeds)
+def post_detail(request, post_id):
+    """The post and a page of its comments, paged by ?cursor=."""
+    fields = requested_fields(request, POST_FIELDS)
+    if fields is None:
+        return error('Неизвестное поле.', 400, fields=list(POST_FIELDS))
+    rows = Post.objects.filter(pk=post_id).values(
+        *{POST_FIELDS[field] for field in fields})
+    if not rows:
+        return error('Запись не найдена.', 404)
+    comments = paginated(
+        request, Comment.objects.filter(post_id=post_id),
+        list(COMMENT_FIELDS), COMMENT_FIELDS, ordering=COMMENT_ORDERING,
+        per_page=COMMENTS_PER_PAGE)
+    return json_response({
+        'post': serialize(rows, fields, POST_FIELDS)[0],
+        'comments': comments,
+    })
@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from yatube.sqlite import tune_connection
+
+        from . import signals  # noqa: F401
+
+        connection_created.connect(tune_connection)
@@ -0,0 +1,198 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
+
+from yatube.instrumentation import record_cache
+
+VERSION_KEY = 'feed-version:{}'
+CARD_KEY = 'post-card:{}.{}:{}:{}'
+GROUPS = 'groups'
+TRENDING = 'trending'
+GROUP_INDEX = 'group-index'
+
+
+def _initial_version():
+    # A version lost to eviction must not come back with a value that was
+    # already used, otherwise fragments rendered before it would revive.
+    return int(time.time() * 1000)
+
+
+def feed_versions(*feeds):
+    keys = {VERSION_KEY.format(feed): feed for feed in feeds}
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    record_cache(len(versions), len(missing))
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump(*feeds):
+    """Invalidate the feeds once the current transaction commits.
+
+    Bumped before the commit, a version could be cached again by a
+    reader that still sees the old rows.
+    """
+    feeds = set(feeds)
+    transaction.on_commit(lambda: _bump(feeds))
+
+
+def _bump(feeds):
+    for feed in feeds:
+        key = VERSION_KEY.format(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def post_version(post_id):
+    return f'post:{post_id}'
+
+
+def follows_version(user_id):
+    return f'follows:{user_id}'
+
+
+def post_feeds(author_id, *group_ids):
+    feeds = ['index', TRENDING, f'profile:{author_id}']
+    feeds.extend(f'group:{pk}' for pk in group_ids if pk is not None)
+    return feeds
+
+
+class FeedCache:
+    """Cache key of a rendered feed page for use with {% cache %}.
+
+    The key combines the versions of the feeds, the requested cursor and
+    the viewer, and changes as soon as any of the feeds is bumped.
+    """
+
+    def __init__(self, request, *feeds):
+        self.request = request
+        self.feeds = feeds + (GROUPS,)
+
+    @property
+    def timeout(self):
+        return settings.FEED_CACHE_TIMEOUT
+
+    @cached_property
+    def key(self):
+        versions = feed_versions(*self.feeds)
+        user = self.request.user
+        viewer = user.pk if user.is_authenticated else 'anon'
+        return ':'.join(
+            [f'{feed}.{versions[feed]}' for feed in self.feeds]
+            + [self.request.GET.get('cursor', ''), str(viewer)]
+        )
+
+
+def feed_etag(request, *feeds):
+    """Weak ETag of a page built from the given feeds.
+
+    Computed from the feed versions alone, so checking it costs a single
+    cache lookup. Pages depend on the viewer, and on whom they follow.
+    """
+    user = request.user
+    feeds += (GROUPS,)
+    if user.is_authenticated:
+        feeds += (follows_version(user.pk),)
+    versions = feed_versions(*feeds)
+    viewer = user.pk if user.is_authenticated else 'anon'
+    tag = ':'.join(
+        [f'{feed}.{versions[feed]}' for feed in feeds]
+        + [request.get_full_path(), str(viewer)]
+    )
+    return 'W/"{}"'.format(hashlib.md5(tag.encode()).hexdigest())
+
+
+def conditional_feed(feeds):
+    """Answer revalidations of a feed view with 304 Not Modified.
+
+    feeds is called with the URL arguments of the view and returns the
+    feeds the page is built from, or None if there is no such page.
+    """
+    def etag(request, *args, **kwargs):
+        names = feeds(*args, **kwargs)
+        if names is None:
+            return None
+        return feed_etag(request, *names)
+
+    def decorator(view):
+        conditional = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            if request.user.is_authenticated:
+                # Logged in visitors must see their own changes at once.
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, public=True, max_age=0,
+                                    s_maxage=settings.FEED_SHARED_MAX_AGE)
+            return response
+        return wrapper
+    return decorator
+
+
+class PostCards:
+    """Rendered posts/includes/post_item.html cards of a page of posts.
+
+    Every card is cached under the generation of its post and of the
+    groups, separately for the author and for everyone else. All the
+    cards of a page are looked up with a single get_many().
+    """
+
+    template_name = 'posts/includes/post_item.html'
+
+    def __init__(self, request, posts):
+        self.user = request.user
+        self.posts = posts
+
+    def __iter__(self):
+        return iter(self._cards)
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __getitem__(self, index):
+        return self._cards[index]
+
+    def _key(self, post, versions):
+        return CARD_KEY.format(
+            post.pk,
+            versions[post_version(post.pk)],
+            versions[GROUPS],
+            int(post.author_id == self.user.pk),
+        )
+
+    @cached_property
+    def _cards(self):
+        posts = list(self.posts)
+        versions = feed_versions(
+            GROUPS, *(post_version(post.pk) for post in posts))
+        keys = [self._key(post, versions) for post in posts]
+        cached = cache.get_many(keys)
+        record_cache(len(cached), len(keys) - len(cached))
+        rendered = {}
+        cards = []
+        for key, post in zip(keys, posts):
+            card = cached.get(key)
+            if card is None:
+                card = rendered[key] = render_to_string(
+                    self.template_name, {'post': post, 'user': self.user})
+            cards.append(mark_safe(card))
+        if rendered:
+            cache.set_many(rendered, settings.FEED_CACHE_TIMEOUT)
+        return cards
@@ -0,0 +1,202 @@
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import (Comment, Follow, Group, GroupAuthorStats, GroupStats,
+                     Post, User, UserStats)
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+# Authors with the most posts shown on the group index.
+TOP_GROUP_AUTHORS = 3
+
+
+def _changes(**deltas):
+    return {field: F(field) + delta for field, delta in deltas.items()}
+
+
+def _not_negative(**deltas):
+    return Q(**{f'{field}__gte': -delta
+                for field, delta in deltas.items() if delta < 0})
+
+
+def bump_user(user_id, **deltas):
+    UserStats.objects.filter(_not_negative(**deltas), user_id=user_id).update(
+        **_changes(**deltas))
+
+
+def bump_users(user_ids, **deltas):
+    UserStats.objects.filter(
+        _not_negative(**deltas), user_id__in=user_ids,
+    ).update(**_changes(**deltas))
+
+
+def bump_post(post_id, comments):
+    Post.objects.filter(
+        _not_negative(comments_count=comments), pk=post_id
+    ).update(**_changes(comments_count=comments))
+
+
+def _group_summary(group_id):
+    top = GroupAuthorStats.objects.filter(
+        group_id=group_id, posts_count__gt=0,
+    ).order_by('-posts_count', 'author_id').values_list(
+        'author_id', 'posts_count')[:TOP_GROUP_AUTHORS]
+    last = Post.objects.filter(group_id=group_id).order_by(
+        '-pub_date').values('pub_date')[:1]
+    return {'last_post_at': Subquery(last),
+            'top_authors': json.dumps(list(top))}
+
+
+def bump_group(group_id, author_id, posts):
+    """Count posts of the author joining (posts > 0) or leaving the
+    group, and refresh its last post date and top authors."""
+    if group_id is None:
+        return
+    authors = GroupAuthorStats.objects.filter(group_id=group_id,
+                                              author_id=author_id)
+    bumped = authors.filter(_not_negative(posts_count=posts)).update(
+        **_changes(posts_count=posts))
+    if not bumped and posts > 0:
+        GroupAuthorStats.objects.bulk_create(
+            [GroupAuthorStats(group_id=group_id, author_id=author_id)],
+            ignore_conflicts=True)
+        authors.update(**_changes(posts_count=posts))
+    GroupStats.objects.filter(
+        _not_negative(posts_count=posts), group_id=group_id,
+    ).update(**_changes(posts_count=posts), **_group_summary(group_id))
+
+
+def group_summaries(groups):
+    """Groups loaded with select_related('stats') and their aggregates,
+    with the names of the top authors read in a single query."""
+    summaries = []
+    for group in groups:
+        try:
+            stats = group.stats
+        except GroupStats.DoesNotExist:
+            stats = GroupStats(group=group)
+        top = json.loads(stats.top_authors or '[]')
+        summaries.append((group, stats, top))
+    names = dict(User.objects.filter(
+        pk__in={pk for _, _, top in summaries for pk, _ in top},
+    ).values_list('pk', 'username')) if summaries else {}
+    return [
+        {
+            'group': group,
+            'posts_count': stats.posts_count,
+            'last_post_at': stats.last_post_at,
+            'top_authors': [
+                {'username': names[pk], 'posts_count': count}
+                for pk, count in top if pk in names
+            ],
+        }
+        for group, stats, top in summaries
+    ]
+
+
+def _count(model, field):
+    rows = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def user_stats(user):
+    """Counters of the user, created on first access if missing."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        counts = User.objects.filter(pk=user.pk).annotate(**{
+            field: _count(model, related)
+            for field, (model, related) in USER_COUNTERS.items()
+        }).values(*USER_COUNTERS).get()
+        stats, _ = UserStats.objects.get_or_create(user=user, defaults=counts)
+        user.stats = stats
+        return stats
+
+
+def reconcile_users():
+    """Recreate missing counters and fix drifted ones, return the fixes."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing.iterator()]
+    )
+    actual = {
+        f'actual_{field}': _count(model, related)
+        for field, (model, related) in USER_COUNTERS.items()
+    }
+    drifted = UserStats.objects.annotate(**actual).exclude(
+        posts_count=F('actual_posts_count'),
+        followers_count=F('actual_followers_count'),
+        following_count=F('actual_following_count'),
+    )
+    fixed = 0
+    for stats in drifted.iterator():
+        UserStats.objects.filter(pk=stats.pk).update(**{
+            field: getattr(stats, f'actual_{field}')
+            for field in USER_COUNTERS
+        })
+        fixed += 1
+    return fixed
+
+
+def reconcile_posts():
+    drifted = Post.objects.annotate(
+        actual=_count(Comment, 'post')
+    ).exclude(comments_count=F('actual')).values_list('pk', 'actual')
+    fixed = 0
+    for pk, actual in drifted.iterator():
+        Post.objects.filter(pk=pk).update(comments_count=actual)
+        fixed += 1
+    return fixed
+
+
+@transaction.atomic
+def reconcile_groups():
+    """Rebuild the aggregates of drifted groups, return how many."""
+    GroupStats.objects.bulk_create(
+        [GroupStats(group_id=pk) for pk in Group.objects.filter(
+            stats__isnull=True).values_list('pk', flat=True)]
+    )
+    rows = Post.objects.filter(group__isnull=False).order_by().values(
+        'group_id', 'author_id').annotate(count=Count('pk'))
+    actual = Counter({(row['group_id'], row['author_id']): row['count']
+                      for row in rows})
+    stored = Counter({
+        (group_id, author_id): count
+        for group_id, author_id, count in GroupAuthorStats.objects.filter(
+            posts_count__gt=0).values_list(
+            'group_id', 'author_id', 'posts_count')
+    })
+    totals = Counter()
+    for (group_id, _), count in actual.items():
+        totals[group_id] += count
+    drifted = {key[0] for key in actual.keys() | stored.keys()
+               if actual[key] != stored[key]}
+    drifted.update(
+        group_id for group_id, posts_count in GroupStats.objects.values_list(
+            'group_id', 'posts_count')
+        if posts_count != totals[group_id])
+    for group_id in drifted:
+        GroupAuthorStats.objects.filter(group_id=group_id).delete()
+        GroupAuthorStats.objects.bulk_create(
+            GroupAuthorStats(group_id=group, author_id=author_id,
+                             posts_count=count)
+            for (group, author_id), count in actual.items()
+            if group == group_id
+        )
+        GroupStats.objects.filter(group_id=group_id).update(
+            posts_count=totals[group_id], **_group_summary(group_id))
+    return len(drifted)
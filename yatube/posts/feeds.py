@@ -0,0 +1,12 @@
+from .models import Post
+
+
+def feed_posts(*conditions, **filters):
+    """Posts prepared for rendering with posts/includes/post_item.html.
+
+    Author and group are joined in and the number of comments is read
+    from the denormalized Post.comments_count, so a page of cards costs
+    a single query however many posts it holds.
+    """
+    return Post.objects.filter(*conditions, **filters).select_related(
+        'author', 'group')
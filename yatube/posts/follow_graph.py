@@ -0,0 +1,136 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from yatube.instrumentation import record_cache
+
+from . import caching
+from .counters import bump_users
+from .models import Follow, User, UserStats
+from .timeline import backfill_many, trim_many
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+GRAPH_KEY = 'follow-graph:{}:{}'
+# The column a set is keyed by and the column it holds.
+COLUMNS = {
+    FOLLOWING: ('user_id', 'author_id'),
+    FOLLOWERS: ('author_id', 'user_id'),
+}
+
+
+def _id_sets(kind, user_ids):
+    """{user id: frozenset of ids} for many users, with one cache lookup
+    and at most one query."""
+    keys = {GRAPH_KEY.format(kind, pk): pk for pk in user_ids}
+    cached = cache.get_many(keys)
+    record_cache(len(cached), len(keys) - len(cached))
+    sets = {keys[key]: ids for key, ids in cached.items()}
+    missing = [pk for pk in keys.values() if pk not in sets]
+    if missing:
+        key_column, value_column = COLUMNS[kind]
+        loaded = defaultdict(set)
+        rows = Follow.objects.filter(
+            **{f'{key_column}__in': missing}
+        ).values_list(key_column, value_column)
+        for pk, other in rows:
+            loaded[pk].add(other)
+        fresh = {pk: frozenset(loaded[pk]) for pk in missing}
+        cache.set_many(
+            {GRAPH_KEY.format(kind, pk): ids for pk, ids in fresh.items()},
+            settings.FOLLOW_GRAPH_TIMEOUT)
+        sets.update(fresh)
+    return sets
+
+
+def following_ids(user_id):
+    return _id_sets(FOLLOWING, [user_id])[user_id]
+
+
+def follower_ids(author_id):
+    return _id_sets(FOLLOWERS, [author_id])[author_id]
+
+
+def is_following(user, author_ids):
+    """{author id: whether the user follows them} for many authors."""
+    if not user.is_authenticated:
+        return dict.fromkeys(author_ids, False)
+    following = following_ids(user.pk)
+    return {pk: pk in following for pk in author_ids}
+
+
+def invalidate(user_ids=(), author_ids=()):
+    keys = ([GRAPH_KEY.format(FOLLOWING, pk) for pk in user_ids]
+            + [GRAPH_KEY.format(FOLLOWERS, pk) for pk in author_ids])
+    # Readers must not cache the state before the commit.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _changed(user, author_ids, delta):
+    # Bulk operations send no signals: counters, timelines and caches
+    # are updated here, once per batch, for the rows actually changed.
+    bump_users([user.pk], following_count=delta * len(author_ids))
+    bump_users(author_ids, followers_count=delta)
+    caching.bump(caching.follows_version(user.pk), f'profile:{user.pk}',
+                 *(f'profile:{pk}' for pk in author_ids))
+    invalidate(user_ids=[user.pk], author_ids=author_ids)
+
+
+@transaction.atomic
+def follow_many(user, author_ids):
+    """Follow the authors, return the ids of the newly followed ones."""
+    # Writing to the user's stats row first takes the write lock, so no
+    # follow of the user can be made concurrently once it is read below.
+    UserStats.objects.filter(user=user).update(
+        following_count=F('following_count'))
+    followed = set(Follow.objects.filter(
+        user=user, author_id__in=author_ids).values_list(
+        'author_id', flat=True))
+    new = set(User.objects.filter(pk__in=author_ids).exclude(
+        pk__in=followed | {user.pk}).values_list('pk', flat=True))
+    Follow.objects.bulk_create(
+        [Follow(user=user, author_id=pk) for pk in new],
+        ignore_conflicts=True)
+    if new:
+        _changed(user, new, 1)
+        backfill_many(user.pk, new)
+    return new
+
+
+@transaction.atomic
+def unfollow_many(user, author_ids):
+    """Unfollow the authors, return the ids of the unfollowed ones."""
+    using = router.db_for_write(Follow)
+    table = connections[using].ops.quote_name(Follow._meta.db_table)
+    unfollowed = set()
+    with connections[using].cursor() as cursor:
+        for pk in set(Follow.objects.filter(
+                user=user, author_id__in=author_ids).values_list(
+                'author_id', flat=True)):
+            # Raw SQL: QuerySet.delete() would send post_delete for every
+            # row, and the row count tells which follows this request
+            # removed rather than a concurrent one.
+            cursor.execute(
+                f'DELETE FROM {table} WHERE user_id = %s AND author_id = %s',
+                [user.pk, pk])
+            if cursor.rowcount:
+                unfollowed.add(pk)
+    if unfollowed:
+        _changed(user, unfollowed, -1)
+        trim_many(user.pk, unfollowed)
+    return unfollowed
+
+
+def suggestions(user, limit=10):
+    """Authors followed by the authors the user follows, most shared
+    first, as [(author id, number of them), ...]."""
+    following = following_ids(user.pk)
+    scores = Counter()
+    for ids in _id_sets(FOLLOWING, following).values():
+        scores.update(ids - following)
+    scores.pop(user.pk, None)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
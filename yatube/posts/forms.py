@@ -1,12 +1,40 @@
 from django import forms
+from django.conf import settings
+from PIL import Image
 
+from .images import downscale_upload, probe_image
 from .models import Comment, Post
 
 
+class PostImageField(forms.ImageField):
+    """Image field that never decodes more of the upload than needed.
+
+    The format and dimensions are read from the header, oversized or
+    malicious images are refused before decoding, and large originals are
+    downscaled before they are stored.
+    """
+
+    def to_python(self, data):
+        file = forms.FileField.to_python(self, data)
+        if file is None:
+            return None
+        if file.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError('Файл слишком большой.',
+                                        code='file_too_large')
+        image_format, size, animated = probe_image(file)
+        file.content_type = Image.MIME.get(image_format)
+        if animated:
+            return file
+        return downscale_upload(file, image_format, size)
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ['text', 'group', 'image']
+        field_classes = {
+            'image': PostImageField,
+        }
         labels = {
             'text': 'Текст',
             'group': 'Группа',
@@ -21,3 +49,11 @@ class CommentForm(forms.ModelForm):
         labels = {
             'text': 'Комментарий',
         }
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Поиск', max_length=200)
+    # A slug, like the author's username: a list of every group would be
+    # read in full on each search.
+    group = forms.SlugField(label='Группа', max_length=50, required=False)
+    author = forms.CharField(label='Автор', max_length=150, required=False)
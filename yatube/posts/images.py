@@ -0,0 +1,253 @@
+import hashlib
+import io
+import json
+import logging
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+
+from yatube.instrumentation import timer
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def thumbnail_options(alias):
+    geometry, options = settings.POST_THUMBNAILS[alias]
+    return geometry, dict(options)
+
+
+def ready_thumbnail(post, alias):
+    """Thumbnail of the post image if it has been generated, None otherwise.
+
+    Unlike sorl's {% thumbnail %}, never decodes or resizes the image:
+    the background job records the thumbnails in the image manifest.
+    """
+    manifest = image_variants(post)
+    if manifest is None:
+        return None
+    thumbnail = manifest.get('thumbnails', {}).get(alias)
+    if thumbnail is None:
+        return None
+    return {**thumbnail, 'url': default_storage.url(thumbnail['name'])}
+
+
+def generate_thumbnails(post):
+    """{alias: name and size of the thumbnail} for the post image."""
+    thumbnails = {}
+    for alias in settings.POST_THUMBNAILS:
+        geometry, options = thumbnail_options(alias)
+        with timer('thumbnail'):
+            thumbnail = get_thumbnail(post.image, geometry, **options)
+        thumbnails[alias] = {'name': thumbnail.name,
+                             'width': thumbnail.width,
+                             'height': thumbnail.height}
+    return thumbnails
+
+
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+
+def variant_formats():
+    Image.init()
+    return [name for name in settings.POST_IMAGE_FORMATS
+            if FORMATS[name][0] in Image.SAVE]
+
+
+def image_variants(post):
+    """Manifest of the responsive variants of the post image."""
+    if not post.image or not post.image_variants:
+        return None
+    manifest = json.loads(post.image_variants)
+    if manifest.get('source') != post.image.name:
+        return None
+    return manifest
+
+
+def _variant_name(post, width, extension):
+    digest = hashlib.md5(post.image.name.encode()).hexdigest()[:12]
+    return f'posts/variants/{post.pk}/{digest}-{width}.{extension}'
+
+
+def _encode(image, format_name):
+    if format_name in ('JPEG', 'AVIF') and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format_name, quality=settings.POST_IMAGE_QUALITY,
+               optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def _widths(size):
+    """Configured widths the image can be cropped to without upscaling,
+    or the largest possible one if it is smaller than all of them."""
+    aspect_width, aspect_height = settings.POST_IMAGE_ASPECT
+    widest = int(min(size[0], size[1] * aspect_width / aspect_height))
+    widths = [width for width in sorted(settings.POST_IMAGE_WIDTHS)
+              if width <= widest]
+    return widths or [max(1, widest)]
+
+
+def generate_variants(post, thumbnails=None):
+    aspect_width, aspect_height = settings.POST_IMAGE_ASPECT
+    widest = max(settings.POST_IMAGE_WIDTHS)
+    largest = (widest, round(widest * aspect_height / aspect_width))
+    with post.image.open('rb') as source:
+        original = Image.open(source)
+        # JPEG can be decoded at a reduced scale, far cheaper than
+        # decoding the whole camera-sized image.
+        original.draft('RGB', largest)
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA', 'L'):
+            original = original.convert('RGBA')
+        widths = _widths(original.size)
+        manifest = {'source': post.image.name, 'formats': {},
+                    'thumbnails': thumbnails or {}}
+        for extension in variant_formats():
+            format_name, mime = FORMATS[extension]
+            sources = []
+            for width in widths:
+                size = (width,
+                        max(1, round(width * aspect_height / aspect_width)))
+                image = ImageOps.fit(original, size, Image.LANCZOS)
+                name = _variant_name(post, width, extension)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                name = default_storage.save(name, _encode(image, format_name))
+                sources.append({'width': width, 'height': size[1],
+                                'name': name})
+            manifest['formats'][extension] = {'type': mime,
+                                              'sources': sources}
+    if post.image_variants:
+        _delete_variants(json.loads(post.image_variants), keep=manifest)
+    Post.objects.filter(pk=post.pk).update(
+        image_variants=json.dumps(manifest))
+    return manifest
+
+
+def delete_variants(post):
+    """Delete the variant files of a deleted post."""
+    if post.image_variants:
+        _delete_variants(json.loads(post.image_variants),
+                         keep={'formats': {}})
+
+
+def _delete_variants(manifest, keep):
+    kept = {source['name'] for variant in keep['formats'].values()
+            for source in variant['sources']}
+    for variant in manifest['formats'].values():
+        for source in variant['sources']:
+            if source['name'] not in kept:
+                default_storage.delete(source['name'])
+
+
+def probe_image(file):
+    """Format and size of an uploaded image, read from its header only."""
+    file.seek(0)
+    try:
+        # Image.open() parses the header and defers decoding. The pixel
+        # limit is enforced below, Pillow's own warning is redundant.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                image_format, size = image.format, image.size
+                animated = getattr(image, 'is_animated', False)
+    except Image.DecompressionBombError:
+        raise ValidationError('Изображение слишком большое.',
+                              code='too_many_pixels')
+    except Exception:
+        raise ValidationError(
+            'Загрузите правильное изображение. Файл, который вы загрузили, '
+            'поврежден или не является изображением.',
+            code='invalid_image')
+    finally:
+        file.seek(0)
+    if image_format not in settings.POST_IMAGE_UPLOAD_FORMATS:
+        raise ValidationError('Неподдерживаемый формат изображения.',
+                              code='invalid_format')
+    if size[0] * size[1] > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError('Изображение слишком большое.',
+                              code='too_many_pixels')
+    return image_format, size, animated
+
+
+def downscale_upload(file, image_format, size):
+    """Shrink an oversized upload, decoding no more than necessary."""
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    if max(size) <= limit:
+        return file
+    scale = limit / max(size)
+    target = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+    with Image.open(file) as image:
+        # draft() lets the JPEG decoder scale down by up to 8x while
+        # decoding, so the full-size bitmap is never allocated. Rotate
+        # only afterwards: exif_transpose() copies the whole image.
+        image.draft(None, target)
+        image.thumbnail(target, Image.LANCZOS, reducing_gap=None)
+        image = ImageOps.exif_transpose(image)
+        buffer = io.BytesIO()
+        options = {'quality': 90} if image_format == 'JPEG' else {}
+        image.save(buffer, image_format, **options)
+    buffer.seek(0, io.SEEK_END)
+    return InMemoryUploadedFile(
+        buffer, 'image', file.name, file.content_type,
+        buffer.tell(), None)
+
+
+def process_post_image(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    thumbnails = generate_thumbnails(post)
+    with timer('variants'):
+        generate_variants(post, thumbnails)
+    # Cards rendered while the thumbnail was missing show the original.
+    caching.bump(caching.post_version(post.pk),
+                 *caching.post_feeds(post.author_id, post.group_id))
+
+
+def _process_in_background(post_id):
+    try:
+        process_post_image(post_id)
+    except Exception:
+        logger.exception('Failed to process the image of post %s', post_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(post):
+    """Process the image of the post after commit, off the request."""
+    if not post.image:
+        return
+    if settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(
+            lambda: executor().submit(_process_in_background, post.pk))
+    else:
+        transaction.on_commit(lambda: process_post_image(post.pk))
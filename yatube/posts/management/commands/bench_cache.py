@@ -0,0 +1,86 @@
+import multiprocessing
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+def create_cache(alias, location):
+    backend = settings.CACHE_BACKENDS.get(alias, alias)
+    return import_string(backend)(location, {
+        'KEY_PREFIX': 'bench',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    })
+
+
+def run_worker(alias, location, operations, keys, seed):
+    # Feed-like workload: a few hot keys get most of the reads, misses
+    # are "rendered" and written back, as the fragment cache does.
+    cache = create_cache(alias, location)
+    rng = random.Random(seed)
+    value = 'x' * 4096
+    hits = 0
+    timings = []
+    for _ in range(operations):
+        key = f'fragment:{int(keys * rng.random() ** 2)}'
+        started = time.perf_counter()
+        if cache.get(key) is None:
+            cache.set(key, value)
+        else:
+            hits += 1
+        timings.append(time.perf_counter() - started)
+    return hits, timings
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает долю попаданий и задержку бэкендов кэша '
+            'при нагрузке из нескольких процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends', default=f'locmem,file,{settings.CACHE_BACKEND}')
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backends = dict.fromkeys(options['backends'].split(','))
+        self.stdout.write(
+            f'{"backend":<12}{"hit rate":>10}{"p50, мкс":>12}'
+            f'{"p99, мкс":>12}{"ops/s":>12}')
+        for alias in backends:
+            self.stdout.write(self.bench(alias, options))
+
+    def bench(self, alias, options):
+        directory = None
+        location = settings.CACHE_LOCATIONS.get(alias, '')
+        if alias == 'file':
+            directory = location = tempfile.mkdtemp(prefix='yatube-bench-')
+        elif alias == settings.CACHE_BACKEND:
+            location = settings.CACHES['default']['LOCATION']
+        create_cache(alias, location).clear()
+        jobs = [
+            (alias, location, options['operations'], options['keys'], seed)
+            for seed in range(options['processes'])
+        ]
+        try:
+            started = time.perf_counter()
+            with multiprocessing.Pool(options['processes']) as pool:
+                results = pool.starmap(run_worker, jobs)
+            elapsed = time.perf_counter() - started
+        finally:
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+        hits = sum(worker_hits for worker_hits, _ in results)
+        timings = sorted(t for _, worker in results for t in worker)
+        total = len(timings)
+        p50 = statistics.median(timings) * 1e6
+        p99 = timings[int(total * 0.99) - 1] * 1e6
+        return (f'{alias:<12}{hits / total:>10.1%}{p50:>12.1f}'
+                f'{p99:>12.1f}{total / elapsed:>12.0f}')
@@ -0,0 +1,134 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from yatube.sqlite import is_locked_error, pragma_statements, run_serialized
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, '
+    'comments_count INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE comment (id INTEGER PRIMARY KEY, post_id INTEGER, '
+    'text TEXT, created REAL)',
+    'CREATE INDEX comment_post ON comment (post_id, created, id)',
+)
+
+
+def connect(path, tuned):
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                 check_same_thread=False)
+    if tuned:
+        for statement in pragma_statements():
+            connection.execute(statement)
+    return connection
+
+
+def add_comment(connection, post_id):
+    # What the add_comment view does: the comment and the counter.
+    connection.execute('BEGIN')
+    try:
+        connection.execute(
+            'INSERT INTO comment (post_id, text, created) VALUES (?, ?, ?)',
+            (post_id, 'x' * 200, time.time()))
+        connection.execute(
+            'UPDATE post SET comments_count = comments_count + 1 '
+            'WHERE id = ?', (post_id,))
+        connection.execute('COMMIT')
+    except sqlite3.Error:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def read_comments(connection, post_id):
+    return connection.execute(
+        'SELECT id, text FROM comment WHERE post_id = ? '
+        'ORDER BY created DESC, id DESC LIMIT 10', (post_id,)).fetchall()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает конкурентную запись в SQLite без настройки '
+            'и в режиме SQLITE_TUNING')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--posts', type=int, default=100)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"mode":<10}{"writes/s":>10}{"reads/s":>10}'
+            f'{"write p99, мс":>15}{"read p99, мс":>14}{"errors":>8}')
+        for mode in ('default', 'tuned'):
+            self.stdout.write(self.bench(mode, options))
+
+    def bench(self, mode, options):
+        tuned = mode == 'tuned'
+        directory = tempfile.TemporaryDirectory(prefix='yatube-bench-')
+        path = os.path.join(directory.name, 'bench.sqlite3')
+        setup = connect(path, tuned)
+        for statement in SCHEMA:
+            setup.execute(statement)
+        setup.executemany('INSERT INTO post (text) VALUES (?)',
+                          [('post',)] * options['posts'])
+        setup.close()
+
+        results = {'write': [], 'read': [], 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def work(kind, seed):
+            rng = random.Random(seed)
+            connection = connect(path, tuned)
+            timings = []
+            errors = 0
+            while time.perf_counter() < deadline:
+                post_id = rng.randint(1, options['posts'])
+                started = time.perf_counter()
+                try:
+                    if kind == 'read':
+                        read_comments(connection, post_id)
+                    elif tuned:
+                        run_serialized(add_comment, connection, post_id)
+                    else:
+                        add_comment(connection, post_id)
+                except sqlite3.OperationalError as error:
+                    if not is_locked_error(error):
+                        raise
+                    errors += 1
+                    continue
+                timings.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                results[kind].extend(timings)
+                results['errors'] += errors
+
+        threads = [
+            threading.Thread(target=work, args=('write', seed))
+            for seed in range(options['writers'])
+        ] + [
+            threading.Thread(target=work, args=('read', seed))
+            for seed in range(options['readers'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        directory.cleanup()
+
+        def p99(timings):
+            if not timings:
+                return 0
+            timings = sorted(timings)
+            return timings[max(0, int(len(timings) * 0.99) - 1)] * 1000
+
+        return (f'{mode:<10}{len(results["write"]) / elapsed:>10.0f}'
+                f'{len(results["read"]) / elapsed:>10.0f}'
+                f'{p99(results["write"]):>15.1f}'
+                f'{p99(results["read"]):>14.1f}{results["errors"]:>8}')
@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from posts.caching import FeedCache, PostCards
+from posts.counters import user_stats
+from posts.feeds import feed_posts
+from posts.models import Group, User
+from posts.paginator import paginate
+from yatube.template_cache import templates_setting
+
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время отрисовки шаблонов ленты, группы и профиля '
+            'для страниц из 10, 50 и 100 записей с кэширующим загрузчиком '
+            'шаблонов и без него. Запросы к базе и кэш в замер не входят.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,50,100')
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.stdout.write(f'{"view":<10}{"posts":>7}{"loader":>9}'
+                          f'{"p50, мс":>10}{"max, мс":>10}{"на запись":>11}')
+        # Fragment caches would hide the rendering being measured.
+        with override_settings(CACHES=NO_CACHE):
+            for view, template, context in self.pages(request, max(sizes)):
+                for size in sizes:
+                    for cached in (False, True):
+                        self.bench(request, view, template, context, size,
+                                   cached, options['repeat'])
+
+    def pages(self, request, size):
+        """The biggest page of each kind, with its context ready."""
+        group = Group.objects.annotate(
+            count=Count('posts')).order_by('-count').first()
+        author = User.objects.annotate(
+            count=Count('posts')).order_by('-count').first()
+        if group is None or author is None:
+            raise CommandError(
+                'База пуста, сначала выполните manage.py generate_data')
+        return [
+            ('index', 'posts/index.html', {
+                'posts': feed_posts(),
+                'feed_cache': FeedCache(request, 'index'),
+            }),
+            ('group', 'posts/group.html', {
+                'posts': feed_posts(group=group),
+                'group': group,
+                'feed_cache': FeedCache(request, f'group:{group.pk}'),
+            }),
+            ('profile', 'posts/profile.html', {
+                'posts': feed_posts(author=author),
+                'author': author,
+                'stats': user_stats(author),
+                'following': False,
+                'feed_cache': FeedCache(request, f'profile:{author.pk}'),
+            }),
+        ]
+
+    def bench(self, request, view, template, context, size, cached, repeat):
+        context = dict(context)
+        page = paginate(request, context.pop('posts'), per_page=size)
+        posts = list(page)
+        with override_settings(TEMPLATES=templates_setting(cached)):
+            # The first render compiles the templates into the cache.
+            render_to_string(template, self.context(request, page, context),
+                             request)
+            timings = []
+            for _ in range(repeat):
+                page_context = self.context(request, page, context)
+                started = time.perf_counter()
+                render_to_string(template, page_context, request)
+                timings.append(time.perf_counter() - started)
+        p50 = statistics.median(timings) * 1000
+        loader = 'cached' if cached else 'plain'
+        per_post = p50 / len(posts) if posts else 0
+        self.stdout.write(
+            f'{view:<10}{len(posts):>7}{loader:>9}{p50:>10.2f}'
+            f'{max(timings) * 1000:>10.2f}{per_post:>11.3f}')
+
+    def context(self, request, page, context):
+        # Cards are rendered lazily, within the measured render.
+        return {**context, 'page': page, 'cards': PostCards(request, page)}
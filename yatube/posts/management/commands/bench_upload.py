@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+
+from django import forms
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.forms import PostImageField
+
+
+def make_upload(path):
+    upload = TemporaryUploadedFile(os.path.basename(path), 'image/jpeg',
+                                   os.path.getsize(path), None)
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+
+def stock_path(upload):
+    # What the form did before: full verification by forms.ImageField,
+    # then a full decode when the first thumbnail is made.
+    forms.ImageField().clean(upload)
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image.load()
+
+
+def streaming_path(upload):
+    stored = PostImageField().clean(upload)
+    stored.read()
+
+
+def measure(path, handler, queue):
+    upload = make_upload(path)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    handler(upload)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(after - before)
+
+
+class Command(BaseCommand):
+    help = ('Измеряет прирост пикового RSS при обработке загруженного '
+            'изображения для разных размеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,3000,6000,8000,12000',
+                            help='Ширины тестовых изображений, 4:3')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(f'{"size":>12}{"file, КБ":>12}'
+                          f'{"stock, МБ":>12}{"streaming, МБ":>16}')
+        with tempfile.TemporaryDirectory() as directory:
+            for width in sizes:
+                height = width * 3 // 4
+                path = os.path.join(directory, f'{width}.jpg')
+                gradient = Image.linear_gradient('L')
+                Image.merge('RGB', (gradient, gradient.rotate(90),
+                                    gradient.rotate(180))).resize(
+                    (width, height)).save(path, 'JPEG', quality=85)
+                peaks = []
+                for handler in (stock_path, streaming_path):
+                    # A fresh process per run: ru_maxrss never goes down.
+                    queue = context.Queue()
+                    process = context.Process(
+                        target=measure, args=(path, handler, queue))
+                    process.start()
+                    peaks.append(queue.get() / 1024)
+                    process.join()
+                self.stdout.write(
+                    f'{f"{width}x{height}":>12}'
+                    f'{os.path.getsize(path) / 1024:>12.0f}'
+                    f'{peaks[0]:>12.1f}{peaks[1]:>16.1f}')
@@ -0,0 +1,110 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts.models import Follow, Post
+from posts.paginator import NEXT, encode_cursor
+from posts.search import tokenize
+
+SCAN = 'scan'
+SORT = 'sort'
+
+
+def plan_problems(cursor, sql):
+    """Full table scans and temporary sorts in the plan of the query."""
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+    problems = []
+    for row in cursor.fetchall():
+        detail = row[-1]
+        if 'USE TEMP B-TREE' in detail:
+            problems.append((SORT, detail))
+        elif (detail.startswith('SCAN') and 'INDEX' not in detail
+              and 'CONSTANT ROW' not in detail and 'SUBQUERY' not in detail):
+            problems.append((SCAN, detail))
+    return problems
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN QUERY PLAN для запросов каждой ленты и '
+            'завершается с ошибкой при полном сканировании или сортировке '
+            'во временном B-дереве')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Поддерживается только SQLite.')
+        post = (Post.objects.filter(group__isnull=False)
+                .select_related('author', 'group').first())
+        follow = Follow.objects.select_related('user').first()
+        if post is None or follow is None:
+            raise CommandError(
+                'Нужны запись в группе и подписка, например: '
+                'manage.py generate_data')
+        cursor = encode_cursor(NEXT, [post.pub_date, post.pk])
+        words = sorted(set(tokenize(post.text)), key=len, reverse=True)
+        anonymous = AnonymousUser()
+        cases = [
+            ('index', reverse('index'), anonymous),
+            ('index, next page', f'{reverse("index")}?cursor={cursor}',
+             anonymous),
+            ('group', reverse('group', args=[post.group.slug]),
+             anonymous),
+            ('group, next page',
+             f'{reverse("group", args=[post.group.slug])}?cursor={cursor}',
+             anonymous),
+            ('profile', reverse('profile', args=[post.author.username]),
+             anonymous),
+            ('profile, next page',
+             f'{reverse("profile", args=[post.author.username])}'
+             f'?cursor={cursor}', anonymous),
+            ('post', reverse('post', args=[post.author.username, post.pk]),
+             anonymous),
+            ('trending', reverse('trending'), anonymous),
+            ('groups', reverse('group_index'), anonymous),
+            ('follow', reverse('follow_index'), follow.user),
+            ('search', f'{reverse("search")}?q={" ".join(words[:1])}',
+             anonymous),
+            ('search in group',
+             f'{reverse("search")}?q={" ".join(words[:1])}'
+             f'&group={post.group.slug}', anonymous),
+            ('search, several words',
+             f'{reverse("search")}?q={" ".join(words[:2])}', anonymous),
+        ]
+        # The relevance summed over several words has no index to be read
+        # in: search_posts() sorts at most SEARCH_CANDIDATES matches,
+        # themselves read through an index.
+        allowed = {
+            ('search, several words', 'USE TEMP B-TREE FOR ORDER BY'),
+        }
+        failed = False
+        for name, url, user in cases:
+            for sql, (kind, detail) in self.explain(url, user):
+                if (name, detail) in allowed:
+                    continue
+                failed = True
+                self.stdout.write(f'{name}: {detail}\n    {sql}')
+        if failed:
+            raise CommandError('Есть запросы без подходящего индекса.')
+        self.stdout.write(f'Проверено лент: {len(cases)}, проблем нет.')
+
+    def explain(self, url, user):
+        request = RequestFactory().get(url)
+        request.user = user
+        match = resolve(request.path_info)
+        # Rendered pages must not come from the cache, and every query
+        # must go to the connection being explained.
+        with override_settings(
+                CACHES={'default': {'BACKEND':
+                        'django.core.cache.backends.dummy.DummyCache'}},
+                DATABASE_REPLICAS=[]):
+            with CaptureQueriesContext(connection) as context:
+                match.func(request, *match.args, **match.kwargs)
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                for problem in plan_problems(cursor, sql):
+                    yield sql, problem
@@ -0,0 +1,168 @@
+import random
+import secrets
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'город река лес поле море небо солнце ветер дождь снег утро вечер '
+    'ночь дорога дом окно книга письмо песня музыка стихи поэт время '
+    'жизнь любовь память мечта работа праздник осень весна лето зима '
+    'друг семья кино театр улица парк кофе чай поезд путешествие'
+).split()
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # bulk_create() would stamp every row with the current time.
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def skewed(rng, count, power):
+    """Index in range(count), small indexes are much more likely."""
+    return int(count * rng.random() ** power)
+
+
+class Command(BaseCommand):
+    help = ('Быстро создаёт много пользователей, групп, записей, подписок и '
+            'комментариев для нагрузочного тестирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--follows-per-user', type=int, default=30)
+        parser.add_argument('--comments-per-post', type=float, default=2)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days']).total_seconds()
+        # Names of this run never clash with existing ones.
+        self.prefix = f'load{secrets.token_hex(3)}'
+
+        user_ids = self.create_users(options['users'])
+        group_ids = self.create_groups(options['groups'])
+        post_ids = self.create_posts(options['posts'], user_ids, group_ids)
+        self.create_follows(user_ids, options['follows_per_user'])
+        comments = int(len(post_ids) * options['comments_per_post'])
+        self.create_comments(post_ids, user_ids, comments)
+
+        self.stdout.write('Пересчёт счётчиков, лент и поискового индекса')
+        # One transaction instead of one per updated row.
+        with transaction.atomic():
+            call_command('recount', stdout=self.stdout)
+            # This run's users follow only each other, their ids were
+            # created together: only timelines in that range change.
+            if user_ids:
+                call_command('rebuild_timelines', from_id=user_ids[0],
+                             to_id=user_ids[-1])
+            call_command('rebuild_search_index')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: префикс {self.prefix}'))
+
+    def random_date(self):
+        # More recent dates are more likely, as in a living site.
+        seconds = self.period * self.rng.random() ** 2
+        return self.now - timedelta(seconds=seconds)
+
+    def text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def insert(self, model, objects):
+        # The database backend picks the size of each INSERT.
+        with transaction.atomic():
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+        self.stdout.write(f'{model.__name__}: {len(objects)}')
+
+    def create_users(self, count):
+        # Hashing is slow on purpose, every user gets the same password.
+        password = make_password('password')
+        self.insert(User, [
+            User(username=f'{self.prefix}_{i}', password=password,
+                 date_joined=self.now)
+            for i in range(count)
+        ])
+        return list(User.objects.filter(
+            username__startswith=f'{self.prefix}_'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_groups(self, count):
+        self.insert(Group, [
+            Group(title=f'Группа {i}', slug=f'{self.prefix}-{i}',
+                  description=self.text(20))
+            for i in range(count)
+        ])
+        return list(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'
+        ).values_list('pk', flat=True))
+
+    def create_posts(self, count, user_ids, group_ids):
+        date = Post._meta.get_field('pub_date')
+        with explicit_dates(date):
+            for start in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - start)
+                self.insert(Post, [
+                    Post(
+                        text=self.text(self.rng.randint(5, 60)),
+                        # A few authors write most of the posts.
+                        author_id=user_ids[
+                            skewed(self.rng, len(user_ids), 2)],
+                        group_id=(self.rng.choice(group_ids)
+                                  if group_ids and self.rng.random() < 0.6
+                                  else None),
+                        pub_date=self.random_date(),
+                    )
+                    for _ in range(size)
+                ])
+        return list(Post.objects.filter(
+            author__username__startswith=f'{self.prefix}_'
+        ).values_list('pk', flat=True))
+
+    def create_follows(self, user_ids, per_user):
+        follows = []
+        for user_id in user_ids:
+            # Popular authors collect most of the followers.
+            authors = {user_ids[skewed(self.rng, len(user_ids), 3)]
+                       for _ in range(self.rng.randint(0, 2 * per_user))}
+            authors.discard(user_id)
+            follows.extend(Follow(user_id=user_id, author_id=author_id)
+                           for author_id in authors)
+            if len(follows) >= self.batch_size:
+                self.insert(Follow, follows)
+                follows = []
+        self.insert(Follow, follows)
+
+    def create_comments(self, post_ids, user_ids, count):
+        if not post_ids:
+            return
+        created = Comment._meta.get_field('created')
+        with explicit_dates(created):
+            for start in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - start)
+                self.insert(Comment, [
+                    Comment(
+                        post_id=post_ids[skewed(self.rng, len(post_ids), 2)],
+                        author_id=self.rng.choice(user_ids),
+                        text=self.text(self.rng.randint(3, 30)),
+                        created=self.random_date(),
+                    )
+                    for _ in range(size)
+                ])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import process_post_image
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры изображений записей'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            process_post_image(post_id)
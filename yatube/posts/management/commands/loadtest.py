@@ -0,0 +1,169 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Post, User
+
+METRICS = ('p50_ms', 'p99_ms', 'queries', 'peak_kib')
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(len(values) * fraction) - 1)]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку (p50/p99), число запросов и пиковую память '
+            'основных представлений на текущей базе, например после '
+            'generate_data. Результаты сохраняются в JSON и сравниваются '
+            'с предыдущим запуском. Внимание: add_comment создаёт '
+            'комментарии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Отключить кэш, чтобы каждая страница отрисовывалась')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост задержки и памяти, доля')
+
+    def handle(self, *args, **options):
+        if options['no_cache']:
+            with override_settings(CACHES=NO_CACHE):
+                views = self.run(options)
+        else:
+            views = self.run(options)
+        result = {
+            'commit': current_commit(),
+            'date': timezone.now().isoformat(),
+            'posts': Post.objects.count(),
+            'users': User.objects.count(),
+            'cache': not options['no_cache'],
+            'views': views,
+        }
+        self.report(views)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.compare(json.load(baseline), result,
+                             options['tolerance'])
+
+    def subjects(self):
+        # The busiest follower, the most commented post and its author:
+        # the heaviest pages of each kind.
+        reader = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows').first()
+        post = Post.objects.select_related('author').order_by(
+            '-comments_count').first()
+        if reader is None or post is None:
+            raise CommandError(
+                'База пуста, сначала выполните manage.py generate_data')
+        return reader, post
+
+    def run(self, options):
+        reader, post = self.subjects()
+        author = post.author.username
+        post_url = reverse('post', args=[author, post.pk])
+        comment_url = reverse('add_comment', args=[author, post.pk])
+        views = {
+            'index': lambda client: client.get(reverse('index')),
+            'follow_index': lambda client: client.get(
+                reverse('follow_index')),
+            'profile': lambda client: client.get(
+                reverse('profile', args=[author])),
+            'post_view': lambda client: client.get(post_url),
+            'add_comment': lambda client: client.post(
+                comment_url, {'text': 'Нагрузочный комментарий'}),
+        }
+        # Not an INTERNAL_IPS address: no debug toolbar.
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        client.force_login(reader)
+        return {name: self.measure(client, request, options)
+                for name, request in views.items()}
+
+    def measure(self, client, request, options):
+        for _ in range(options['warmup']):
+            request(client)
+        timings = []
+        queries = []
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(client)
+                timings.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                path = response.request['PATH_INFO']
+                raise CommandError(f'{response.status_code} от {path}')
+            queries.append(len(captured))
+        # Tracing slows Python down, so memory is measured separately.
+        tracemalloc.start()
+        peaks = []
+        for _ in range(max(1, options['requests'] // 10)):
+            tracemalloc.reset_peak()
+            request(client)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        return {
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'queries': max(queries),
+            'peak_kib': round(max(peaks) / 1024, 1),
+        }
+
+    def report(self, views):
+        self.stdout.write(f'{"view":<14}' + ''.join(
+            f'{metric:>10}' for metric in METRICS))
+        for name, metrics in views.items():
+            self.stdout.write(f'{name:<14}' + ''.join(
+                f'{metrics[metric]:>10}' for metric in METRICS))
+
+    def compare(self, baseline, result, tolerance):
+        if baseline['cache'] != result['cache']:
+            raise CommandError('Запуски с кэшем и без него несравнимы.')
+        regressions = []
+        for name, metrics in result['views'].items():
+            before = baseline['views'].get(name)
+            if before is None:
+                continue
+            for metric in METRICS:
+                old, new = before[metric], metrics[metric]
+                # Any extra query is a regression, timings and memory
+                # are noisy.
+                limit = old if metric == 'queries' else old * (1 + tolerance)
+                change = (new - old) / old if old else 0
+                self.stdout.write(
+                    f'{name:<14}{metric:>10}{old:>10}{new:>10}{change:>+9.0%}')
+                if new > limit:
+                    regressions.append(f'{name} {metric}: {old} -> {new}')
+        if regressions:
+            raise CommandError(
+                f'Регрессия относительно {baseline["commit"]}: '
+                + '; '.join(regressions))
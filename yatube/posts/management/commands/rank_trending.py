@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import rank
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает ленту популярного. Без --full оцениваются '
+            'только записи из ленты и записи с новыми комментариями '
+            'с прошлого запуска; запускайте часто, например раз в минуту, '
+            'а с --full — раз в день')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Оценить заново все записи за TRENDING_MAX_AGE_HOURS')
+
+    def handle(self, *args, **options):
+        ranked = rank(full=options['full'])
+        self.stdout.write(f'В ленте популярного записей: {ranked}')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс записей'
+
+    def handle(self, *args, **options):
+        rebuild_index()
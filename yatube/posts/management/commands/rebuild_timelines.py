@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок пользователей: перечисленных, '
+            'с идентификаторами из диапазона --from-id/--to-id или всех')
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+        parser.add_argument('--from-id', type=int)
+        parser.add_argument('--to-id', type=int)
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or None
+        bounds = {'pk__gte': options['from_id'], 'pk__lte': options['to_id']}
+        bounds = {key: value for key, value in bounds.items()
+                  if value is not None}
+        if bounds:
+            # A subquery: a range can hold more users than SQLite allows
+            # query parameters.
+            users = User.objects.filter(**bounds).values('pk')
+            if user_ids is not None:
+                users = users.filter(pk__in=user_ids)
+            user_ids = users
+        rebuild(user_ids)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_groups, reconcile_posts, reconcile_users
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики записей, комментариев, подписок и групп '
+            'с базой')
+
+    def handle(self, *args, **options):
+        users = reconcile_users()
+        posts = reconcile_posts()
+        groups = reconcile_groups()
+        self.stdout.write(
+            f'Исправлено счётчиков: пользователей {users}, записей {posts}, '
+            f'групп {groups}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import cap_all
+
+
+class Command(BaseCommand):
+    help = ('Обрезает ленты подписок до TIMELINE_MAX_ENTRIES последних '
+            'записей; запускайте регулярно, например раз в час')
+
+    def handle(self, *args, **options):
+        capped = cap_all()
+        self.stdout.write(f'Обрезано лент: {capped}')
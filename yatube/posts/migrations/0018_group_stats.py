@@ -0,0 +1,78 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:47
+
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupAuthorStats = apps.get_model('posts', 'GroupAuthorStats')
+
+    rows = list(Post.objects.filter(group__isnull=False).order_by().values(
+        'group_id', 'author_id').annotate(count=Count('pk')))
+    GroupAuthorStats.objects.bulk_create(
+        GroupAuthorStats(group_id=row['group_id'], author_id=row['author_id'],
+                         posts_count=row['count'])
+        for row in rows
+    )
+    last = dict(Post.objects.filter(group__isnull=False).order_by().values(
+        'group_id').annotate(last=Max('pub_date')).values_list(
+        'group_id', 'last'))
+    stats = []
+    for pk in Group.objects.values_list('pk', flat=True):
+        authors = sorted(
+            ((row['author_id'], row['count']) for row in rows
+             if row['group_id'] == pk),
+            key=lambda author: (-author[1], author[0]))
+        stats.append(GroupStats(
+            group_id=pk,
+            posts_count=sum(count for _, count in authors),
+            last_post_at=last.get(pk),
+            # Must match posts.counters.TOP_GROUP_AUTHORS.
+            top_authors=json.dumps(authors[:3]),
+        ))
+    GroupStats.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group')),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('last_post_at', models.DateTimeField(blank=True, null=True)),
+                ('top_authors', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GroupAuthorStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_stats', to=settings.AUTH_USER_MODEL)),
+                ('group', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='author_stats', to='posts.Group')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='groupauthorstats',
+            index=models.Index(fields=['group', '-posts_count', 'author'], name='group_top_authors'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupauthorstats',
+            constraint=models.UniqueConstraint(fields=('group', 'author'), name='unique_group_author'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
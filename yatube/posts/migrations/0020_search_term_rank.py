@@ -0,0 +1,17 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_timeline_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'weight', 'post'], name='search_term_rank'),
+        ),
+    ]
@@ -10,14 +10,31 @@ class Post(models.Model):
     text = models.TextField(validators=[validate_not_empty])
     pub_date = models.DateTimeField('date published', auto_now_add=True,
                                     db_index=True)
+    # Both are covered by the feed indexes below.
     author = models.ForeignKey(User, on_delete=models.CASCADE,
-                               related_name='posts')
+                               related_name='posts', db_index=False)
     group = models.ForeignKey('Group', on_delete=models.SET_NULL,
-                              related_name='posts', blank=True, null=True)
+                              related_name='posts', blank=True, null=True,
+                              db_index=False)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    image_variants = models.TextField(blank=True, default='', editable=False)
+    # False if the post was not copied into the followers' timelines, as
+    # its author had too many followers: follow feeds merge it on read.
+    fanned_out = models.BooleanField(default=True, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        # Feeds filter on one column and page by (pub_date, id).
+        indexes = [
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='post_author_feed'),
+            models.Index(fields=['group', 'pub_date', 'id'],
+                         name='post_group_feed'),
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='post_merged_feed',
+                         condition=models.Q(fanned_out=False)),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -32,14 +49,59 @@ class Group(models.Model):
         return self.title
 
 
+class GroupStats(models.Model):
+    """Aggregates of a group, kept up to date by posts.counters."""
+
+    group = models.OneToOneField(Group, on_delete=models.CASCADE,
+                                 primary_key=True, related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(blank=True, null=True)
+    # JSON list of [author id, posts] of the most active authors.
+    top_authors = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f'{self.group_id}: {self.posts_count} posts'
+
+
+class GroupAuthorStats(models.Model):
+    # Covered by the unique constraint below.
+    group = models.ForeignKey(Group, on_delete=models.CASCADE,
+                              related_name='author_stats', db_index=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='group_stats')
+    posts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group', 'author'],
+                name='unique_group_author')
+        ]
+        indexes = [
+            models.Index(fields=['group', '-posts_count', 'author'],
+                         name='group_top_authors'),
+        ]
+
+    def __str__(self):
+        return f'{self.author_id} in {self.group_id}: {self.posts_count}'
+
+
 class Comment(models.Model):
     post = models.ForeignKey('Post', on_delete=models.CASCADE,
-                             related_name='comments')
+                             related_name='comments', db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='comments')
     text = models.TextField()
     created = models.DateTimeField('date published', auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created'),
+            # Recent comments of all posts, read by posts.trending.
+            models.Index(fields=['created'], name='comment_created'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -59,3 +121,73 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user.username} is following {self.author.username}'
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.posts_count} posts'
+
+
+class TimelineEntry(models.Model):
+    # Covered by the feed index below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline', db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    # A copy of Post.pub_date: the timeline is paged by its own index.
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_feed'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} in timeline of {self.user_id}'
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='unique_search_term')
+        ]
+        indexes = [
+            models.Index(fields=['term', 'weight', 'post'],
+                         name='search_term_rank'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class TrendingPost(models.Model):
+    """A post of the top-N list kept by the rank_trending command."""
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE,
+                                primary_key=True, related_name='trending')
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+    recent_comments = models.PositiveIntegerField(default=0)
+    ranked_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.rank}: {self.post_id}'
@@ -0,0 +1,255 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from collections.abc import Sequence
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+POSTS_PER_PAGE = 10
+FEED_ORDERING = ('-pub_date', '-id')
+COMMENTS_PER_PAGE = 50
+COMMENT_ORDERING = ('created', 'id')
+GROUPS_PER_PAGE = 30
+GROUP_ORDERING = ('slug',)
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+# Integers SQLite can compare with: larger ones fail the query.
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _cursor_value(value):
+    # Unlike DjangoJSONEncoder, keep full microsecond precision: the
+    # boundary row has to compare equal to itself.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], default=_cursor_value,
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidCursor(token)
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        raise InvalidCursor(token)
+    return direction, values
+
+
+class CursorPaginator:
+    """Keyset pagination over a strictly ordered set of fields.
+
+    Pages are addressed by opaque cursors that encode the ordering values
+    of the boundary row, so every page is a single index range scan
+    regardless of its depth and no COUNT(*) is needed to navigate.
+
+    With sources, the ids of the rows come from several querysets, each
+    one paged through its own index, and object_list only loads the rows
+    of the page. A source is a (queryset, {ordering field: its column})
+    pair, the columns default to the field names.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING,
+                 approximate_count=False,
+                 count_timeout=COUNT_CACHE_TIMEOUT, sources=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.approximate_count = approximate_count
+        self.count_timeout = count_timeout
+        self.sources = sources
+
+    @cached_property
+    def fields(self):
+        return [(name.lstrip('-'), name.startswith('-'))
+                for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        """Return a valid page, even if the cursor is malformed."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+    def page(self, cursor=None):
+        direction, values = NEXT, None
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            values = self._to_python(values)
+        return CursorPage(self, direction, values)
+
+    @cached_property
+    def count(self):
+        """Total number of rows, cached and therefore only approximate."""
+        query = str(self.object_list.query).encode()
+        key = 'paginator-count:' + hashlib.md5(query).hexdigest()
+        total = cache.get(key)
+        if total is None:
+            total = self.object_list.count()
+            cache.set(key, total, self.count_timeout)
+        return total
+
+    def _to_python(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        opts = self.object_list.model._meta
+        converted = []
+        for (name, _), value in zip(self.fields, values):
+            # Cursors only ever hold strings and integers, anything else
+            # was crafted.
+            if isinstance(value, bool) or not isinstance(value, (str, int)):
+                raise InvalidCursor(values)
+            try:
+                value = opts.get_field(name).to_python(value)
+            except FieldDoesNotExist:
+                pass
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise InvalidCursor(values)
+            if isinstance(value, int) and not MIN_INT <= value <= MAX_INT:
+                raise InvalidCursor(values)
+            converted.append(value)
+        return converted
+
+    def _seek(self, values, forward, names=None):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        names = names or [name for name, _ in self.fields]
+        condition = Q()
+        for index, (name, (_, descending)) in enumerate(
+                zip(names, self.fields)):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_index in range(index):
+                term &= Q(**{names[prev_index]: values[prev_index]})
+            condition |= term
+        return condition
+
+    def _order_by(self, forward, names=None):
+        names = names or [name for name, _ in self.fields]
+        return tuple(
+            name if descending != forward else f'-{name}'
+            for name, (_, descending) in zip(names, self.fields))
+
+    def _merged(self, forward, values):
+        """Ids of the page rows, merged from the sources.
+
+        Every source is ordered by an index of its own: SQLite merges them
+        (MERGE (UNION ALL)) without sorting.
+        """
+        names = [name for name, _ in self.fields]
+        arms = []
+        for queryset, columns in self.sources:
+            columns = [columns.get(name, name) for name in names]
+            arm = queryset.values_list(*columns)
+            if values is not None:
+                arm = arm.filter(self._seek(values, forward, columns))
+            arms.append((arm.order_by(), columns))
+        (first, columns), *rest = arms
+        if rest:
+            first = first.union(*(arm for arm, _ in rest), all=True)
+        rows = first.order_by(*self._order_by(forward, columns))
+        return [row[names.index('id')] for row in rows[:self.per_page + 1]]
+
+    def fetch(self, direction, values):
+        forward = direction == NEXT
+        if self.sources is not None:
+            ids = self._merged(forward, values)
+            found = {self._value(row, 'id'): row
+                     for row in self.object_list.filter(pk__in=ids).order_by()}
+            rows = [found[pk] for pk in ids if pk in found]
+        else:
+            queryset = self.object_list.order_by(*self._order_by(forward))
+            if values is not None:
+                queryset = queryset.filter(self._seek(values, forward))
+            rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        return rows, has_more
+
+    @staticmethod
+    def _value(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def cursor_for(self, row, direction):
+        values = [self._value(row, name) for name, _ in self.fields]
+        return encode_cursor(direction, values)
+
+
+class CursorPage(Sequence):
+    def __init__(self, paginator, direction, values):
+        self.paginator = paginator
+        self.direction = direction
+        self.values = values
+
+    def __repr__(self):
+        return f'<CursorPage {self.direction} {self.values!r}>'
+
+    @cached_property
+    def _result(self):
+        return self.paginator.fetch(self.direction, self.values)
+
+    @property
+    def object_list(self):
+        return self._result[0]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        if self.direction == NEXT:
+            return self._result[1]
+        return True
+
+    def has_previous(self):
+        if self.direction == NEXT:
+            return self.values is not None
+        return self._result[1]
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self.paginator.cursor_for(self.object_list[0], PREVIOUS)
+
+    @property
+    def total(self):
+        if not self.paginator.approximate_count:
+            return None
+        return self.paginator.count
+
+
+def paginate(request, object_list, per_page=POSTS_PER_PAGE, **kwargs):
+    paginator = CursorPaginator(object_list, per_page, **kwargs)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+
+from .feeds import feed_posts
+from .models import Post, SearchTerm
+
+TOKEN_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+SEARCH_ORDERING = ('-score', '-match')
+BATCH_SIZE = 1000
+# Matches of a query of several words ranked at most.
+SEARCH_CANDIDATES = 1000
+
+
+def tokenize(text):
+    text = text.lower().replace('ё', 'е')
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text)
+            if len(token) >= MIN_TERM_LENGTH]
+
+
+def terms_for(post):
+    return [SearchTerm(post=post, term=term, weight=weight)
+            for term, weight in Counter(tokenize(post.text)).items()]
+
+
+def index_post(post):
+    SearchTerm.objects.filter(post=post).delete()
+    SearchTerm.objects.bulk_create(terms_for(post))
+
+
+@transaction.atomic
+def rebuild_index():
+    SearchTerm.objects.all().delete()
+    terms = []
+    for post in Post.objects.only('pk', 'text').iterator():
+        terms.extend(terms_for(post))
+        if len(terms) >= BATCH_SIZE:
+            SearchTerm.objects.bulk_create(terms)
+            terms = []
+    SearchTerm.objects.bulk_create(terms)
+
+
+def search_posts(query, **filters):
+    """Posts containing every word of the query, best matches first.
+
+    The score is the total number of occurrences of the query words in
+    the post; paginate the result with SEARCH_ORDERING.
+
+    The posts are read through the (term, weight, post) index of the
+    longest word, the other words are looked up per post. A single word
+    is therefore ranked by the index itself. Several words are summed
+    and sorted, over the SEARCH_CANDIDATES matches where the longest
+    word occurs most: the rest are not found.
+    """
+    terms = sorted(set(tokenize(query)[:MAX_QUERY_TERMS]),
+                   key=lambda term: (-len(term), term))
+    if not terms:
+        return Post.objects.none()
+    first, *rest = terms
+    if not rest:
+        return feed_posts(search_terms__term=first, **filters).annotate(
+            score=F('search_terms__weight'), match=F('search_terms__post'))
+    candidates = SearchTerm.objects.filter(
+        term=first, **{f'post__{name}': value
+                       for name, value in filters.items()})
+    for index, term in enumerate(rest):
+        candidates = candidates.annotate(**{f'has_{index}': Exists(
+            SearchTerm.objects.filter(term=term, post=OuterRef('post')))
+        }).filter(**{f'has_{index}': True})
+    candidates = candidates.order_by('-weight', '-post_id').values('post')
+    weights = [Subquery(SearchTerm.objects.filter(
+        term=term, post=OuterRef('pk')).values('weight')[:1])
+        for term in terms]
+    return feed_posts(pk__in=candidates[:SEARCH_CANDIDATES]).annotate(
+        score=sum(weights[1:], weights[0]), match=F('pk'))
@@ -0,0 +1,181 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import caching, follow_graph
+from .counters import bump_group, bump_post, bump_user
+from .images import delete_variants, schedule_image_processing
+from .models import (Comment, Follow, Group, GroupStats, Post, User,
+                     UserStats)
+from .search import index_post
+from .timeline import backfill, fan_out, trim
+
+
+# Posts whose deletion is under way, by the thread deleting them.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_user(instance.author_id, posts_count=1)
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_group_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump_group(instance.group_id, instance.author_id, 1)
+    elif instance.group_id != instance._previous_group_id:
+        # Moved to another group by post_edit.
+        bump_group(instance._previous_group_id, instance.author_id, -1)
+        bump_group(instance.group_id, instance.author_id, 1)
+    else:
+        return
+    caching.bump(caching.GROUP_INDEX)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_group_post(sender, instance, **kwargs):
+    if instance.group_id is not None:
+        bump_group(instance.group_id, instance.author_id, -1)
+        caching.bump(caching.GROUP_INDEX)
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_post(instance.post_id, 1)
+
+
+@receiver(pre_delete, sender=Post)
+def mark_deleted_post(sender, instance, **kwargs):
+    # The deletion of a post, or of its author, cascades to its comments:
+    # their receivers have no counter or feed left to update.
+    _deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unmark_deleted_post(sender, instance, **kwargs):
+    _deleting_posts().discard(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.post_id not in _deleting_posts():
+        bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_user(instance.author_id, followers_count=1)
+        bump_user(instance.user_id, following_count=1)
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    bump_user(instance.author_id, followers_count=-1)
+    bump_user(instance.user_id, following_count=-1)
+    trim(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        previous = Post.objects.filter(pk=instance.pk).values(
+            'group_id', 'image').first() or {}
+        instance._previous_group_id = previous.get('group_id')
+        instance._previous_image = previous.get('image')
+
+
+@receiver(post_save, sender=Post)
+def process_new_image(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    if created or instance.image.name != instance._previous_image:
+        schedule_image_processing(instance)
+
+
+@receiver(post_delete, sender=Post)
+def delete_post_variants(sender, instance, **kwargs):
+    # Files cannot be rolled back, they go once the row is gone for good.
+    transaction.on_commit(lambda: delete_variants(instance))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    caching.bump(
+        caching.post_version(instance.pk),
+        *caching.post_feeds(instance.author_id, instance.group_id,
+                            previous_group_id),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts():
+        return
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'group_id').first()
+    if post is not None:
+        caching.bump(
+            caching.post_version(instance.post_id),
+            *caching.post_feeds(post['author_id'], post['group_id']),
+        )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    caching.bump(caching.GROUPS, f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, **kwargs):
+    # Profiles show the numbers of followers and followed authors, profile
+    # and post pages show the follower a follow or an unfollow button.
+    caching.bump(f'profile:{instance.author_id}',
+                 f'profile:{instance.user_id}',
+                 caching.follows_version(instance.user_id))
+    follow_graph.invalidate(user_ids=[instance.user_id],
+                            author_ids=[instance.author_id])
@@ -0,0 +1,45 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from ..images import image_variants, ready_thumbnail
+
+register = template.Library()
+
+SIZES = '(max-width: 992px) 100vw, 960px'
+FALLBACK_TYPES = ('image/jpeg', 'image/png')
+
+
+def _srcset(variant):
+    return ', '.join(
+        f'{default_storage.url(source["name"])} {source["width"]}w'
+        for source in variant['sources']
+    )
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post):
+    manifest = image_variants(post)
+    variants = [variant for variant in manifest['formats'].values()
+                if variant['sources']] if manifest else []
+    if not variants:
+        return {'post': post, 'thumbnail': ready_thumbnail(post, 'card')}
+    # The <img> needs a format every browser reads, the original image
+    # serves if none of them could be written.
+    if variants[-1]['type'] not in FALLBACK_TYPES:
+        img = {'src': post.image.url}
+    else:
+        fallback = variants.pop()
+        middle = fallback['sources'][len(fallback['sources']) // 2]
+        img = {
+            'src': default_storage.url(middle['name']),
+            'srcset': _srcset(fallback),
+            'width': middle['width'],
+            'height': middle['height'],
+        }
+    return {
+        'post': post,
+        'sizes': SIZES,
+        'sources': [{'type': variant['type'], 'srcset': _srcset(variant)}
+                    for variant in variants],
+        'fallback': img,
+    }
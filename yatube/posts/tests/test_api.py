@@ -0,0 +1,303 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from yatube.queries import query_budget
+
+from .. import api, caching
+from ..models import Comment, Follow, Group, Post
+from .utils import run_on_commit
+
+User = get_user_model()
+
+
+class CommentBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.user = User.objects.create_user(username='Leon')
+        cls.post = Post.objects.create(text='Первая', author=cls.author)
+        cls.other_post = Post.objects.create(text='Вторая', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def post_batch(self, comments, client=None):
+        return (client or self.client).post(
+            reverse('api_comments'), json.dumps({'comments': comments}),
+            content_type='application/json')
+
+    def test_batch_is_created_with_counters(self):
+        """Пакет комментариев создаётся вместе со счётчиками."""
+        versions = caching.feed_versions(
+            caching.post_version(self.post.pk), 'index')
+        with run_on_commit():
+            response = self.post_batch([
+                {'post': self.post.pk, 'text': 'Раз'},
+                {'post': self.post.pk, 'text': 'Два'},
+                {'post': self.other_post.pk, 'text': 'Три'},
+            ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 3})
+        self.assertEqual(
+            Comment.objects.filter(author=self.user).count(), 3)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments_count, 2)
+        self.assertEqual(
+            Post.objects.get(pk=self.other_post.pk).comments_count, 1)
+        self.assertNotEqual(caching.feed_versions(
+            caching.post_version(self.post.pk), 'index'), versions)
+        self.assertIn('primary_until', response.cookies)
+
+    def test_invalid_batch_is_rejected_whole(self):
+        """Пакет с ошибкой отклоняется целиком."""
+        response = self.post_batch([
+            {'post': self.post.pk, 'text': 'Раз'},
+            {'post': self.post.pk, 'text': ''},
+            {'post': 0, 'text': 'Три'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors), {'1', '2'})
+        self.assertIn('text', errors['1'])
+        self.assertIn('post', errors['2'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_post_must_be_an_id(self):
+        """Запись задаётся только целым идентификатором."""
+        for post in ([self.post.pk], True, str(self.post.pk), None):
+            with self.subTest(post=post):
+                response = self.post_batch([{'post': post, 'text': 'Раз'}])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('post', response.json()['errors']['0'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_text_must_be_a_string(self):
+        """Текст комментария задаётся только строкой."""
+        for text in ([1, 2], {'a': 1}, 5, True, None):
+            with self.subTest(text=text):
+                response = self.post_batch([{'post': self.post.pk,
+                                             'text': text}])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('text', response.json()['errors']['0'])
+        self.assertFalse(Comment.objects.exists())
+
+    @override_settings(COMMENT_BATCH_SIZE=2)
+    def test_batch_size_is_limited(self):
+        """Размер пакета ограничен."""
+        response = self.post_batch(
+            [{'post': self.post.pk, 'text': 'Раз'}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_guest_gets_401(self):
+        """Гость получает 401, а не перенаправление."""
+        response = self.post_batch(
+            [{'post': self.post.pk, 'text': 'Раз'}], client=Client())
+        self.assertEqual(response.status_code, 401)
+
+    def test_malformed_json(self):
+        """Некорректный JSON отклоняется."""
+        response = self.client.post(reverse('api_comments'), 'not json',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_dont_depend_on_batch_size(self):
+        """Число запросов не растёт с размером пакета."""
+        comments = [{'post': self.post.pk, 'text': f'Комментарий {i}'}
+                    for i in range(50)]
+        with query_budget(10):
+            response = self.post_batch(comments)
+        self.assertEqual(response.status_code, 201)
+
+
+class FeedApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.user = User.objects.create_user(username='Leon')
+        cls.group = Group.objects.create(title='Поэты', slug='poets',
+                                         description='Описание')
+        for i in range(12):
+            Post.objects.create(text=f'Запись {i}', author=cls.author,
+                                group=cls.group if i % 2 else None)
+        cls.post = Post.objects.latest('id')
+        for i in range(3):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_feeds_are_paged_by_cursor(self):
+        """Ленты отдаются страницами по курсору."""
+        urls = {
+            reverse('api_posts'): 12,
+            reverse('api_group_posts', args=['poets']): 6,
+            reverse('api_profile_posts', args=['Zenon']): 12,
+        }
+        for url, total in urls.items():
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                self.assertEqual(len(first['results']), min(total, 10))
+                self.assertIsNone(first['previous'])
+                seen = [post['id'] for post in first['results']]
+                if first['next']:
+                    second = self.client.get(
+                        url, {'cursor': first['next']}).json()
+                    seen += [post['id'] for post in second['results']]
+                self.assertEqual(len(set(seen)), total)
+                self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_post_fields(self):
+        """Запись сериализуется с автором и группой."""
+        post = self.client.get(reverse('api_posts')).json()['results'][0]
+        self.assertEqual(post['id'], self.post.pk)
+        self.assertEqual(post['author'], 'Zenon')
+        self.assertEqual(post['group'], 'poets')
+        self.assertEqual(post['comments_count'], 3)
+        self.assertIsNone(post['image'])
+        self.assertEqual(set(post), {'id', 'text', 'pub_date', 'author',
+                                     'group', 'image', 'comments_count'})
+
+    def test_sparse_fields(self):
+        """?fields= ограничивает набор полей."""
+        response = self.client.get(reverse('api_posts'),
+                                   {'fields': 'id,text'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'text'})
+        response = self.client.get(reverse('api_posts'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_detail_with_comments(self):
+        """Запись отдаётся вместе с комментариями по порядку."""
+        response = self.client.get(reverse('api_post', args=[self.post.pk]))
+        data = response.json()
+        self.assertEqual(data['post']['id'], self.post.pk)
+        self.assertEqual([comment['text'] for comment
+                          in data['comments']['results']],
+                         ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'])
+        self.assertEqual(data['comments']['results'][0]['author'], 'Leon')
+
+    def test_missing_objects_are_404(self):
+        """Несуществующие объекты — 404 в JSON."""
+        urls = (
+            reverse('api_post', args=[0]),
+            reverse('api_group_posts', args=['missing']),
+            reverse('api_profile_posts', args=['missing']),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', response.json())
+
+    def test_follow_feed(self):
+        """Лента подписок доступна только авторизованным."""
+        self.assertEqual(
+            self.client.get(reverse('api_follow')).status_code, 401)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_follow'))
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_feed_is_cheap(self):
+        """Лента читается одним запросом и поддерживает 304."""
+        with query_budget(1):
+            response = self.client.get(reverse('api_posts'))
+        revalidated = self.client.get(
+            reverse('api_posts'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_encoder_fallback(self):
+        """Без orjson ответ тот же."""
+        url = reverse('api_post', args=[self.post.pk])
+        fast = self.client.get(url).json()
+        with mock.patch.object(api, 'orjson', None):
+            cache.clear()
+            self.assertEqual(self.client.get(url).json(), fast)
+
+
+class FollowApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Leon')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def post_follows(self, data):
+        return self.client.post(reverse('api_follow_authors'),
+                                json.dumps(data),
+                                content_type='application/json')
+
+    def test_bulk_follow_and_unfollow(self):
+        """Подписка и отписка на многих авторов одним запросом."""
+        first, second, third = self.authors
+        response = self.post_follows(
+            {'follow': [first.pk, second.pk, third.pk]})
+        self.assertEqual(response.json(), {
+            'followed': [first.pk, second.pk, third.pk], 'unfollowed': []})
+        response = self.post_follows(
+            {'follow': [first.pk], 'unfollow': [second.pk]})
+        self.assertEqual(response.json(),
+                         {'followed': [], 'unfollowed': [second.pk]})
+        self.assertEqual(
+            set(Follow.objects.filter(user=self.user).values_list(
+                'author_id', flat=True)), {first.pk, third.pk})
+
+    def test_invalid_follows_are_rejected(self):
+        """Некорректные запросы отклоняются."""
+        for data in ({'follow': 'all'}, {'unfollow': ['1']}, [1],
+                     {'follow': [True]}):
+            with self.subTest(data=data):
+                self.assertEqual(self.post_follows(data).status_code, 400)
+        with override_settings(FOLLOW_BATCH_SIZE=2):
+            response = self.post_follows(
+                {'follow': [author.pk for author in self.authors]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_suggestions(self):
+        """Советы строятся по подпискам авторов пользователя."""
+        first, second, third = self.authors
+        Follow.objects.create(user=self.user, author=first)
+        Follow.objects.create(user=first, author=second)
+        response = self.client.get(reverse('api_follow_suggestions'))
+        self.assertEqual(response.json(), {'results': [
+            {'id': second.pk, 'username': 'author1', 'followed_by': 1}]})
+        self.assertEqual(Client().get(
+            reverse('api_follow_suggestions')).status_code, 401)
+
+
+class GroupApiTests(TestCase):
+    def test_groups(self):
+        """Список групп со статистикой."""
+        author = User.objects.create_user(username='Zenon')
+        group = Group.objects.create(title='Поэты', slug='poets',
+                                     description='описание')
+        Group.objects.create(title='Прозаики', slug='prose',
+                             description='описание')
+        post = Post.objects.create(text='текст', author=author, group=group)
+        with query_budget(2):
+            response = self.client.get(reverse('api_groups'))
+        results = response.json()['results']
+        self.assertEqual([item['slug'] for item in results],
+                         ['poets', 'prose'])
+        self.assertEqual(results[0]['posts_count'], 1)
+        self.assertEqual(results[0]['last_post_at'],
+                         post.pub_date.isoformat())
+        self.assertEqual(results[0]['top_authors'],
+                         [{'username': 'Zenon', 'posts_count': 1}])
+        self.assertEqual(results[1]['top_authors'], [])
@@ -1,10 +1,14 @@
+import io
 import shutil
+import struct
 import tempfile
+import zlib
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Post, Group, User
 
@@ -133,3 +137,56 @@ class PostCreateFormTests(TestCase):
                 post=post
             ).exists()
         )
+
+
+class PostImageFieldTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.user = User.objects.create_user(username='Zenon')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def post_image(self, name, content):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            return self.authorized_client.post(reverse('new_post'), {
+                'text': 'Текст',
+                'image': SimpleUploadedFile(name, content),
+            })
+
+    def test_huge_image_is_rejected_from_header(self):
+        """Изображение с огромным числом пикселей отклоняется
+        по заголовку."""
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data)))
+        header = struct.pack('>IIBBBBB', 10000, 10000, 8, 2, 0, 0, 0)
+        bomb = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+                + chunk(b'IEND', b''))
+        response = self.post_image('bomb.png', bomb)
+        self.assertFormError(response, 'form', 'image',
+                             'Изображение слишком большое.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image_is_rejected(self):
+        """Файл, не являющийся изображением, отклоняется."""
+        response = self.post_image('fake.jpg', b'not an image')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['image'])
+
+    def test_large_image_is_downscaled(self):
+        """Слишком большое изображение уменьшается перед сохранением."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 200), 'red').save(buffer, 'JPEG')
+        self.post_image('wide.jpg', buffer.getvalue())
+        with self.settings(MEDIA_ROOT=self.media_root):
+            with Image.open(Post.objects.get().image) as image:
+                self.assertEqual(image.size, (2560, 171))
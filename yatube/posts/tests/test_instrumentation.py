@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from yatube import instrumentation
+from yatube.queries import normalize
+
+from .. import caching
+from ..models import Post
+from .utils import run_on_commit
+
+User = get_user_model()
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Zenon')
+        Post.objects.create(text='Запись', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.reset()
+        self.client = Client()
+
+    def test_sampled_request_has_server_timing(self):
+        """Замеренный запрос получает заголовок Server-Timing."""
+        response = self.client.get(reverse('index'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'queries', 'tpl;dur=', 'cache;desc=',
+                       'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_measured(self):
+        """Запрос вне выборки не замеряется."""
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(instrumentation.exposition(), '\n')
+
+    def test_metrics_aggregate_requests(self):
+        """Метрики собираются в гистограммы по представлениям."""
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('yatube_request_ms_count{view="index"} 2', content)
+        self.assertIn('yatube_queries_bucket{view="index",le="+Inf"} 2',
+                      content)
+        self.assertRegex(content, r'yatube_cache_hits_total\{view="index"\} '
+                                  r'[1-9]')
+
+    def test_metrics_are_local(self):
+        """Метрики недоступны с чужих адресов."""
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_timer_outside_request(self):
+        """Таймер работает и вне запроса, например в пуле миниатюр."""
+        with instrumentation.timer('thumbnail'):
+            pass
+        self.assertIn('yatube_thumbnail_ms_count 1',
+                      instrumentation.exposition())
+
+
+class QueryDetectorTests(TestCase):
+    def test_normalized_queries_match_across_rows(self):
+        """Запросы для разных строк сводятся к одному шаблону."""
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id = 5 AND name = 'it''s'"),
+            normalize('SELECT * FROM t\n WHERE id = 17 AND name = %s'),
+        )
+        self.assertEqual(normalize('SELECT 1 WHERE id IN (%s, %s, %s)'),
+                         'SELECT ? WHERE id IN (...)')
+
+    @override_settings(QUERY_DETECTOR_MODE='log',
+                       QUERY_DETECTOR_SAMPLE_RATE=1)
+    def test_log_mode_logs_repeated_queries(self):
+        """В режиме log повторяющиеся запросы только пишутся в лог."""
+        user = User.objects.create_user(username='Zenon')
+        with run_on_commit():
+            for i in range(5):
+                Post.objects.create(text=f'Запись {i}', author=user)
+        render = caching.render_to_string
+
+        def render_with_query(template_name, context):
+            context['post'].comments.count()
+            return render(template_name, context)
+
+        with mock.patch.object(caching, 'render_to_string',
+                               render_with_query):
+            with self.assertLogs('yatube.queries', 'WARNING') as logs:
+                response = Client().get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('in render_with_query', logs.output[0])
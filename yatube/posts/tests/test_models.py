@@ -1,7 +1,20 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 
-from ..models import Post, Group
+from .. import caching, follow_graph, trending
+from ..counters import reconcile_groups, reconcile_users
+from ..models import (Comment, Follow, Group, GroupAuthorStats, GroupStats,
+                      Post, TimelineEntry, TrendingPost, UserStats)
+from .utils import run_on_commit
 
 
 class PostModelTest(TestCase):
@@ -41,3 +54,373 @@ group.title."""
         post = self.post
         expected_object_name = post.title
         self.assertEqual(expected_object_name, str(post))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.user = User.objects.create_user(username='user')
+
+    def test_counters_follow_changes(self):
+        """Счётчики обновляются при создании и удалении объектов."""
+        post = Post.objects.create(text='текст', author=self.author)
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='комментарий')
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.user.stats.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            (self.author.stats.posts_count,
+             self.author.stats.followers_count,
+             self.user.stats.following_count),
+            (1, 1, 1)
+        )
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.user.stats.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.author.stats.followers_count, 0)
+        self.assertEqual(self.user.stats.following_count, 0)
+
+    def test_cascade_skips_comments_of_deleted_posts(self):
+        """Удаление записи или автора не обновляет счётчики каждого
+        комментария удаляемых записей."""
+        def deletion_queries(comments):
+            post = Post.objects.create(text='текст', author=self.author)
+            Comment.objects.bulk_create(
+                Comment(post=post, author=self.user, text='комментарий')
+                for _ in range(comments))
+            with CaptureQueriesContext(connection) as context:
+                post.delete()
+            return len(context)
+
+        self.assertEqual(deletion_queries(1), deletion_queries(30))
+        leaving = User.objects.create_user(username='leaving')
+        other = Post.objects.create(text='текст', author=self.user)
+        Comment.objects.create(post=other, author=leaving,
+                               text='комментарий')
+        Comment.objects.create(post=Post.objects.create(
+            text='текст', author=leaving), author=self.user,
+            text='комментарий')
+        leaving.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.comments_count, 0)
+
+    def test_recount_fixes_drift(self):
+        """Команда recount исправляет расхождения счётчиков."""
+        post = Post.objects.create(text='текст', author=self.author)
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=self.user, text='ok')] * 3)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.user).delete()
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertTrue(UserStats.objects.filter(user=self.user).exists())
+
+    def test_recount_creates_stats_in_bulk(self):
+        """recount создаёт сотни недостающих счётчиков одной вставкой:
+        SQLite ограничивает число строк в INSERT."""
+        User.objects.bulk_create(
+            [User(username=f'user{i}') for i in range(600)])
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(UserStats.objects.count(), User.objects.count())
+
+
+class GroupStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.user = User.objects.create_user(username='user')
+        cls.group = Group.objects.create(title='Поэты', slug='poets',
+                                         description='описание')
+        cls.other = Group.objects.create(title='Прозаики', slug='prose',
+                                         description='описание')
+
+    def stats(self, group):
+        stats = GroupStats.objects.get(group=group)
+        return (stats.posts_count, stats.last_post_at,
+                json.loads(stats.top_authors or '[]'))
+
+    def test_stats_follow_posts(self):
+        """Статистика группы обновляется при создании, переносе
+        и удалении записей."""
+        first = Post.objects.create(text='раз', author=self.author,
+                                    group=self.group)
+        second = Post.objects.create(text='два', author=self.author,
+                                     group=self.group)
+        third = Post.objects.create(text='три', author=self.user,
+                                    group=self.group)
+        self.assertEqual(self.stats(self.group), (
+            3, third.pub_date, [[self.author.pk, 2], [self.user.pk, 1]]))
+
+        third.group = self.other
+        third.save()
+        self.assertEqual(self.stats(self.group),
+                         (2, second.pub_date, [[self.author.pk, 2]]))
+        self.assertEqual(self.stats(self.other),
+                         (1, third.pub_date, [[self.user.pk, 1]]))
+
+        second.delete()
+        first.delete()
+        self.assertEqual(self.stats(self.group), (0, None, []))
+        self.assertEqual(reconcile_groups(), 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Сверка пересобирает статистику разошедшихся групп."""
+        post = Post.objects.create(text='раз', author=self.author,
+                                   group=self.group)
+        Post.objects.bulk_create(
+            [Post(text='без сигналов', author=self.user, group=self.other)])
+        GroupAuthorStats.objects.filter(group=self.group).update(
+            posts_count=5)
+        self.assertEqual(reconcile_groups(), 2)
+        self.assertEqual(self.stats(self.group),
+                         (1, post.pub_date, [[self.author.pk, 1]]))
+        self.assertEqual(self.stats(self.other)[0], 1)
+        self.assertEqual(reconcile_groups(), 0)
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(4)]
+        cls.author_ids = [author.pk for author in cls.authors]
+        for author in cls.authors:
+            Post.objects.create(text='текст', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_follow_many_keeps_counters_and_timeline(self):
+        """Массовая подписка обновляет счётчики и ленту без сигналов."""
+        followed = follow_graph.follow_many(
+            self.user, self.author_ids[:3] + [self.user.pk])
+        self.assertEqual(followed, set(self.author_ids[:3]))
+        self.assertEqual(
+            follow_graph.follow_many(self.user, self.author_ids[:3]), set())
+        self.assertEqual(reconcile_users(), 0)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 3)
+
+        unfollowed = follow_graph.unfollow_many(
+            self.user, self.author_ids[1:])
+        self.assertEqual(unfollowed, set(self.author_ids[1:3]))
+        self.assertEqual(reconcile_users(), 0)
+        self.assertEqual(
+            list(Follow.objects.filter(user=self.user).values_list(
+                'author_id', flat=True)), self.author_ids[:1])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 1)
+
+    def test_follow_many_inserts_in_bulk(self):
+        """Число запросов массовой подписки не зависит от числа авторов."""
+        def follow_queries(author_ids):
+            with CaptureQueriesContext(connection) as context:
+                followed = follow_graph.follow_many(self.user, author_ids)
+            self.assertEqual(followed, set(author_ids))
+            return len(context)
+
+        self.assertEqual(follow_queries(self.author_ids[:1]),
+                         follow_queries(self.author_ids[1:]))
+        self.assertEqual(reconcile_users(), 0)
+
+    def test_id_sets_are_cached_and_invalidated(self):
+        """Множества подписок кэшируются и сбрасываются при изменениях."""
+        self.assertEqual(follow_graph.following_ids(self.user.pk), set())
+        with self.assertNumQueries(0):
+            following = follow_graph.is_following(self.user,
+                                                  self.author_ids)
+        self.assertFalse(any(following.values()))
+
+        with run_on_commit():
+            follow = Follow.objects.create(user=self.user,
+                                           author=self.authors[0])
+        self.assertEqual(follow_graph.following_ids(self.user.pk),
+                         {self.authors[0].pk})
+        self.assertEqual(follow_graph.follower_ids(self.authors[0].pk),
+                         {self.user.pk})
+        with run_on_commit():
+            follow.delete()
+        self.assertEqual(follow_graph.follower_ids(self.authors[0].pk),
+                         set())
+
+        with run_on_commit():
+            follow_graph.follow_many(self.user, self.author_ids[1:3])
+        self.assertEqual(follow_graph.following_ids(self.user.pk),
+                         set(self.author_ids[1:3]))
+
+    def test_suggestions_come_from_followed_authors(self):
+        """Советуют авторов, на которых подписаны авторы пользователя."""
+        first, second, third, fourth = self.authors
+        follow_graph.follow_many(self.user, [first.pk, second.pk])
+        follow_graph.follow_many(first, [third.pk, fourth.pk, self.user.pk])
+        follow_graph.follow_many(second, [fourth.pk, first.pk])
+        # The user's follows and those of all their authors at once.
+        with self.assertNumQueries(2):
+            follow_graph.suggestions(self.user)
+        with self.assertNumQueries(0):
+            suggested = follow_graph.suggestions(self.user)
+        self.assertEqual(suggested, [(fourth.pk, 2), (third.pk, 1)])
+        self.assertEqual(follow_graph.suggestions(self.user, limit=1),
+                         [(fourth.pk, 2)])
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.user = User.objects.create_user(username='user')
+        cls.quiet, cls.busy = [
+            Post.objects.create(text=text, author=cls.author)
+            for text in ('тихая', 'обсуждаемая')]
+
+    def ranked(self):
+        return list(TrendingPost.objects.order_by('rank').values_list(
+            'post_id', flat=True))
+
+    def test_commented_posts_rank_first(self):
+        """Обсуждаемые записи поднимаются выше."""
+        for _ in range(3):
+            Comment.objects.create(post=self.busy, author=self.user,
+                                   text='ok')
+        self.assertEqual(trending.rank(), 2)
+        self.assertEqual(self.ranked(), [self.busy.pk, self.quiet.pk])
+        self.assertEqual(
+            TrendingPost.objects.get(post=self.busy).recent_comments, 3)
+
+    def test_incremental_run_rescores_changed_posts(self):
+        """Повторный запуск учитывает новые комментарии и записи."""
+        with self.settings(TRENDING_SIZE=1):
+            trending.rank()
+            self.assertEqual(self.ranked(), [self.busy.pk])
+            for _ in range(3):
+                Comment.objects.create(post=self.quiet, author=self.user,
+                                       text='ok')
+            trending.rank()
+            self.assertEqual(self.ranked(), [self.quiet.pk])
+
+    def test_old_posts_are_dropped(self):
+        """Старые записи не попадают в ленту популярного."""
+        Post.objects.filter(pk=self.quiet.pk).update(
+            pub_date=self.quiet.pub_date - timedelta(days=30))
+        trending.rank(full=True)
+        self.assertEqual(self.ranked(), [self.busy.pk])
+
+
+class FollowGraphCommitTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user')
+        self.author = User.objects.create_user(username='author')
+
+    def test_sets_are_dropped_after_commit(self):
+        """Закэшированные множества сбрасываются после фиксации."""
+        self.assertEqual(follow_graph.following_ids(self.user.pk), set())
+        self.assertEqual(follow_graph.follower_ids(self.author.pk), set())
+        follow_graph.follow_many(self.user, [self.author.pk])
+        self.assertEqual(follow_graph.following_ids(self.user.pk),
+                         {self.author.pk})
+        follow_graph.unfollow_many(self.user, [self.author.pk])
+        self.assertEqual(follow_graph.follower_ids(self.author.pk), set())
+        self.assertEqual(reconcile_users(), 0)
+
+    def test_caches_are_kept_until_commit(self):
+        """Кэши сбрасываются только после фиксации, откат их не трогает."""
+        feeds = ('index', f'profile:{self.author.pk}')
+        versions = caching.feed_versions(*feeds)
+        following = follow_graph.following_ids(self.user.pk)
+        with transaction.atomic():
+            post = Post.objects.create(text='текст', author=self.author)
+            Follow.objects.create(user=self.user, author=self.author)
+            self.assertEqual(caching.feed_versions(*feeds), versions)
+            self.assertEqual(follow_graph.following_ids(self.user.pk),
+                             following)
+        self.assertNotEqual(caching.feed_versions(*feeds), versions)
+        self.assertEqual(follow_graph.following_ids(self.user.pk),
+                         {self.author.pk})
+        versions = caching.feed_versions(*feeds)
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                post.delete()
+                raise DatabaseError
+        self.assertEqual(caching.feed_versions(*feeds), versions)
+
+
+class FeedIndexesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='Zenon')
+        follower = User.objects.create_user(username='Leon')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        post = Post.objects.create(text='Запись в группе', author=author,
+                                   group=group)
+        Comment.objects.create(post=post, author=follower, text='Ответ')
+        Follow.objects.create(user=follower, author=author)
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы и не сортируют без индекса."""
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        self.assertIn('проблем нет', out.getvalue())
+
+
+class LoadDataTest(TestCase):
+    def test_generated_data_is_consistent(self):
+        """Сгенерированные данные согласованы со счётчиками и лентами."""
+        call_command('generate_data', users=20, posts=100, groups=3,
+                     follows_per_user=3, seed=1, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(
+            UserStats.objects.filter(posts_count__gt=0).exists())
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('пользователей 0, записей 0', out.getvalue())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user).count(),
+            Post.objects.filter(
+                author__following__user=follow.user).count())
+
+    def test_loadtest_reports_every_view(self):
+        """Нагрузочный тест сохраняет метрики каждого представления."""
+        call_command('generate_data', users=10, posts=30, groups=2,
+                     follows_per_user=3, seed=1, stdout=StringIO())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('loadtest', requests=2, warmup=0,
+                         output=output.name, stdout=StringIO())
+            result = json.load(output)
+        self.assertEqual(set(result['views']), {
+            'index', 'follow_index', 'profile', 'post_view', 'add_comment'})
+        for metrics in result['views'].values():
+            self.assertGreater(metrics['queries'], 0)
+
+    def test_rebuild_timelines_of_a_range(self):
+        """Ленты пересобираются только у пользователей из диапазона."""
+        author, first, second = [
+            User.objects.create_user(username=name)
+            for name in ('author', 'first', 'second')]
+        Post.objects.create(text='старый текст', author=author)
+        post = Post.objects.create(text='текст', author=author)
+        for user in (first, second):
+            Follow.objects.create(user=user, author=author)
+        TimelineEntry.objects.all().delete()
+        with override_settings(TIMELINE_MAX_ENTRIES=1):
+            call_command('rebuild_timelines', from_id=first.pk,
+                         to_id=first.pk)
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list(
+                'user_id', 'post_id', 'pub_date')),
+            [(first.pk, post.pk, post.pub_date)])
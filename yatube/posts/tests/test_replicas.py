@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from yatube.routers import ReplicaRouter, replica_reads
+
+from ..models import Post
+
+User = get_user_model()
+
+
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Zenon')
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_reads_go_to_replica_only_inside_block(self):
+        """Чтение уходит на реплику только внутри replica_reads."""
+        self.assertIsNone(self.router.db_for_read(Post))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            self.assertIsNone(self.router.db_for_read(Session))
+            self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_read(Post))
+
+    # The test database has no replicas, the primary stands in for one.
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_feed_views_read_from_replica(self):
+        """Ленты читают с реплики, пока клиент ничего не записал."""
+        with mock.patch('yatube.routers.replica_reads',
+                        wraps=replica_reads) as reads:
+            self.client.get(reverse('index'))
+            self.assertEqual(reads.call_count, 1)
+
+            response = self.client.post(reverse('new_post'),
+                                        {'text': 'Текст'})
+            self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+            self.client.get(reverse('index'))
+            self.assertEqual(reads.call_count, 1)
+
+
+# A replica that has not replicated anything yet: an empty database.
+@override_settings(DATABASE_REPLICAS=['lagging'])
+class LaggingReplicaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.databases['lagging'] = dict(
+            settings.DATABASES['default'], NAME=':memory:', TEST={})
+        with override_settings(DATABASE_REPLICAS=[]):
+            call_command('migrate', database='lagging', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['lagging'].close()
+        del connections['lagging']
+        del connections.databases['lagging']
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Zenon',
+                                             password='password')
+        self.client = Client()
+
+    def test_new_user_is_read_from_primary(self):
+        """Пользователь, которого ещё нет на реплике, авторизован и
+        имеет страницу профиля."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['user'], self.user)
+        response = self.client.get(
+            reverse('profile', args=[self.user.username]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_and_signup_pin_to_primary(self):
+        """Вход и регистрация закрепляют клиента за основной базой."""
+        response = self.client.post(reverse('login'), {
+            'username': 'Zenon', 'password': 'password'})
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        response = Client().post(reverse('signup'), {
+            'username': 'Leon', 'password1': 'Sup3r-secret',
+            'password2': 'Sup3r-secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
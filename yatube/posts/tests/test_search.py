@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Group, Post, SearchTerm
+from ..search import search_posts
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(
+            title='Поэты',
+            slug='test-slug',
+            description='Это описание группы Поэты'
+        )
+        cls.author = User.objects.create_user(username='Zenon')
+        cls.other = User.objects.create_user(username='mayak')
+        cls.rare = Post.objects.create(
+            text='Ёлка у дома', author=cls.author, group=cls.group)
+        cls.often = Post.objects.create(
+            text='Ёлка, ёлка, снова ёлка у дома', author=cls.other)
+        Post.objects.create(text='Совсем другое', author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_results_are_ranked(self):
+        """Записи с большим числом совпадений идут первыми."""
+        self.assertEqual(list(search_posts('елка дома')),
+                         [self.often, self.rare])
+
+    def test_several_words_rank_bounded_candidates(self):
+        """Запрос из нескольких слов ранжирует только записи, где самое
+        длинное слово встречается чаще всего."""
+        with mock.patch('posts.search.SEARCH_CANDIDATES', 1):
+            self.assertEqual(list(search_posts('ёлка дома')), [self.often])
+            self.assertEqual(
+                list(search_posts('ёлка дома', group=self.group)),
+                [self.rare])
+
+    def test_all_words_must_match(self):
+        """Находятся только записи со всеми словами запроса."""
+        self.assertEqual(list(search_posts('ёлка другое')), [])
+        self.assertEqual(list(search_posts('!')), [])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при изменении и удалении записи."""
+        post = Post.objects.get(pk=self.rare.pk)
+        post.text = 'Сосна'
+        post.save()
+        self.assertEqual(list(search_posts('ёлка')), [self.often])
+        self.assertEqual(list(search_posts('сосна')), [post])
+        post.delete()
+        self.assertFalse(SearchTerm.objects.filter(term='сосна').exists())
+
+    def test_index_inserts_in_bulk(self):
+        """Запись из сотен разных слов индексируется и переиндексируется
+        целиком: SQLite ограничивает число строк в INSERT."""
+        words = ' '.join(f'слово{i}' for i in range(600))
+        post = Post.objects.create(text=words, author=self.author)
+        self.assertEqual(SearchTerm.objects.filter(post=post).count(), 600)
+        call_command('rebuild_search_index')
+        self.assertEqual(SearchTerm.objects.filter(post=post).count(), 600)
+        self.assertEqual(list(search_posts('слово599')), [post])
+
+    def test_search_page_filters_and_paginates(self):
+        """Страница поиска фильтрует по группе и автору и листается
+        курсором."""
+        url = reverse('search')
+        filters = {
+            'group': (self.group.slug, [self.rare]),
+            'author': ('mayak', [self.often]),
+        }
+        for field, (value, expected) in filters.items():
+            with self.subTest(field=field):
+                response = self.guest_client.get(
+                    url, {'q': 'ёлка', field: value})
+                self.assertEqual(list(response.context['page']), expected)
+        for i in range(10):
+            Post.objects.create(text=f'ёлка {i}', author=self.author)
+        response = self.guest_client.get(url, {'q': 'ёлка'})
+        page = response.context['page']
+        self.assertEqual(page[0], self.often)
+        self.assertContains(response, f'q=%D1%91%D0%BB%D0%BA%D0%B0&amp;'
+                                      f'cursor={page.next_cursor}')
+        response = self.guest_client.get(
+            url, {'q': 'ёлка', 'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['page']), 2)
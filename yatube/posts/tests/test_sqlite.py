@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from yatube.sqlite import run_serialized, tune_connection
+
+from ..models import Post
+
+User = get_user_model()
+
+
+@override_settings(SQLITE_WRITE_BACKOFF=0)
+class SqliteTuningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Zenon')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    @override_settings(SQLITE_TUNING=True,
+                       SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_pragmas_applied_to_connection(self):
+        """Настройки SQLite применяются к новому соединению."""
+        tune_connection(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+    def test_locked_database_is_retried(self):
+        """Запись повторяется, пока база заблокирована."""
+        write = mock.Mock(side_effect=[
+            OperationalError('database is locked'),
+            OperationalError('database is locked'),
+            'done',
+        ])
+        self.assertEqual(run_serialized(write), 'done')
+        self.assertEqual(write.call_count, 3)
+
+    @override_settings(SQLITE_WRITE_RETRIES=2)
+    def test_retries_are_limited(self):
+        """Число повторов ограничено, другие ошибки не повторяются."""
+        write = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            run_serialized(write)
+        self.assertEqual(write.call_count, 3)
+        write = mock.Mock(side_effect=OperationalError('no such table'))
+        with self.assertRaises(OperationalError):
+            run_serialized(write)
+        self.assertEqual(write.call_count, 1)
+
+    @override_settings(SQLITE_TUNING=True)
+    def test_writing_view_retried_in_transaction(self):
+        """Запись в базу повторяется в транзакции."""
+        save = Post.save
+        calls = []
+
+        def locked_once(post, *args, **kwargs):
+            self.assertTrue(connection.in_atomic_block)
+            calls.append(post.text)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return save(post, *args, **kwargs)
+
+        with mock.patch.object(Post, 'save', locked_once):
+            response = self.client.post(reverse('new_post'),
+                                        {'text': 'Повтор'})
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Post.objects.filter(text='Повтор').count(), 1)
+
+    @override_settings(SQLITE_TUNING=True)
+    def test_only_writes_are_serialized(self):
+        """Очередь на запись занимает только сохранение, а не форма
+        и отрисовка страницы."""
+        with mock.patch('yatube.sqlite.run_serialized',
+                        wraps=run_serialized) as run:
+            self.client.get(reverse('new_post'))
+            self.client.post(reverse('new_post'), {'text': ''})
+            self.assertFalse(run.called)
+            self.client.post(reverse('new_post'), {'text': 'Запись'})
+        self.assertEqual(run.call_count, 1)
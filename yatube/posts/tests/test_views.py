@@ -1,15 +1,40 @@
+import io
+import json
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 
-from ..models import Follow, Group, Post
+from yatube import template_cache
+from yatube.queries import QueryPatternError, query_budget
+from yatube.template_cache import templates_setting
+
+from .. import caching
+from ..caching import PostCards
+from ..feeds import feed_posts
+from ..forms import PostForm
+from ..images import image_variants, process_post_image, ready_thumbnail
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from ..paginator import (COMMENTS_PER_PAGE, NEXT, CursorPaginator,
+                         encode_cursor)
+from ..templatetags.post_images import post_picture
+from ..timeline import timeline_sources
+from ..trending import rank as rank_trending
+from .utils import run_on_commit
 
 User = get_user_model()
 
@@ -155,7 +180,7 @@ class PostPagesTests(InitTests):
             reverse('group', kwargs={'slug': 'mayak'})
         )
         group = response.context['group']
-        count_post = response.context['page'].object_list.count()
+        count_post = len(response.context['page'].object_list)
         self.assertEqual(group, self.group_mayak)
         self.assertEqual(count_post, 0)
 
@@ -217,13 +242,333 @@ class PostPagesTests(InitTests):
         """Кэш главной страницы работает правильно"""
         response = self.authorized_client_author.get(reverse('index'))
         cached_content = response.content
-        Post.objects.create(text='Новый пост', author=self.author)
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response = self.authorized_client_author.get(reverse('index'))
         self.assertEqual(cached_content, response.content)
         cache.clear()
         response = self.authorized_client_author.get(reverse('index'))
         self.assertNotEqual(cached_content, response.content)
 
+    def test_cache_is_invalidated_on_changes(self):
+        """Кэш лент сбрасывается при изменении записей, комментариев
+        и групп."""
+        urls = (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': 'Zenon'}),
+        )
+        changes = (
+            lambda: Post.objects.create(text='Новый пост',
+                                        author=self.author, group=self.group),
+            lambda: Comment.objects.create(post=self.post, author=self.user,
+                                           text='Комментарий'),
+            lambda: self.group.save(),
+        )
+        for change in changes:
+            keys = {url: self.guest_client.get(url).context['feed_cache'].key
+                    for url in urls}
+            with run_on_commit():
+                change()
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.guest_client.get(url)
+                    self.assertNotEqual(response.context['feed_cache'].key,
+                                        keys[url])
+
+    def test_cache_is_invalidated_on_group_change(self):
+        """Запись пропадает из кэша прежней группы после переноса."""
+        url = reverse('group', kwargs={'slug': 'test-slug'})
+        self.assertContains(self.guest_client.get(url), 'текст')
+        self.post.group = self.group_mayak
+        with run_on_commit():
+            self.post.save()
+        self.assertNotContains(self.guest_client.get(url), 'post_1')
+
+    def test_cache_differs_between_pages(self):
+        """Страницы ленты кэшируются отдельно."""
+        for i in range(10):
+            Post.objects.create(text=f'текст {i}', author=self.author)
+        response = self.guest_client.get(reverse('index'))
+        cursor = response.context['page'].next_cursor
+        second = self.guest_client.get(reverse('index'), {'cursor': cursor})
+        self.assertNotEqual(response.content, second.content)
+        self.assertContains(second, 'post_1"')
+
+
+class FollowTimelineTest(InitTests):
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def follow_feed(self):
+        response = self.client.get(reverse('follow_index'))
+        return list(response.context['page'])
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента подписок заполняется при подписке и новой записи
+        и очищается при отписке."""
+        self.client.get(
+            reverse('profile_follow', kwargs={'username': 'Zenon'}))
+        self.assertEqual(self.follow_feed(), [self.post])
+        new_post = Post.objects.create(text='новая', author=self.author)
+        self.assertEqual(self.follow_feed(), [new_post, self.post])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(),
+                         2)
+        self.client.get(
+            reverse('profile_unfollow', kwargs={'username': 'Zenon'}))
+        self.assertEqual(self.follow_feed(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_prolific_author_is_merged_on_read(self):
+        """Записи популярных авторов подмешиваются при чтении."""
+        Follow.objects.create(user=self.user, author=self.author)
+        new_post = Post.objects.create(text='новая', author=self.author)
+        self.assertFalse(new_post.fanned_out)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.user).values_list(
+                'post_id', flat=True)),
+            [self.post.pk])
+        self.assertEqual(self.follow_feed(), [new_post, self.post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_no_posts_lost_across_the_fanout_limit(self):
+        """Записи не теряются, когда автор становится популярным и
+        перестаёт им быть."""
+        Follow.objects.create(user=self.user, author=self.author)
+        second = Follow.objects.create(
+            user=User.objects.create_user(username='second'),
+            author=self.author)
+        prolific = Post.objects.create(text='популярный', author=self.author)
+        second.delete()
+        regular = Post.objects.create(text='снова обычный',
+                                      author=self.author)
+        self.assertEqual(self.follow_feed(), [regular, prolific, self.post])
+        newcomer = User.objects.create_user(username='newcomer')
+        Follow.objects.create(user=newcomer, author=self.author)
+        self.client.force_login(newcomer)
+        self.assertEqual(self.follow_feed(), [regular, prolific, self.post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_merged_feed_is_paged_through_indexes(self):
+        """Лента подписок листается по курсору через материализованную
+        ленту и записи популярных авторов."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.user, author=other)
+        # Materialized while the author had no followers yet.
+        posts = [Post.objects.create(text=f'обычная {i}', author=other)
+                 for i in range(3)]
+        Follow.objects.create(user=self.user, author=self.author)
+        posts += [Post.objects.create(text=f'популярная {i}',
+                                      author=self.author)
+                  for i in range(3)]
+        expected = sorted(posts + [self.post],
+                          key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        paginator = CursorPaginator(feed_posts(), 3,
+                                    sources=timeline_sources(self.user))
+        pages, page = [], paginator.page()
+        while True:
+            pages.append(list(page))
+            if not page.next_cursor:
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual([post for page in pages for post in page], expected)
+        back = paginator.page(page.previous_cursor)
+        self.assertEqual(list(back), pages[-2])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=2)
+    def test_timeline_is_capped(self):
+        """Лента хранит не больше TIMELINE_MAX_ENTRIES записей."""
+        posts = [Post.objects.create(text=f'запись {i}', author=self.author)
+                 for i in range(3)]
+        Follow.objects.create(user=self.user, author=self.author)
+        entries = TimelineEntry.objects.filter(user=self.user)
+        self.assertEqual(set(entries.values_list('post_id', flat=True)),
+                         {posts[2].pk, posts[1].pk})
+        new_post = Post.objects.create(text='новая', author=self.author)
+        self.assertEqual(entries.count(), 3)
+        call_command('trim_timelines', stdout=io.StringIO())
+        self.assertEqual(set(entries.values_list('post_id', flat=True)),
+                         {new_post.pk, posts[2].pk})
+
+    def test_backfill_inserts_in_bulk(self):
+        """Подписка копирует в ленту сотни записей автора: SQLite
+        ограничивает число строк в INSERT."""
+        Post.objects.bulk_create(
+            [Post(text=f'запись {i}', author=self.author)
+             for i in range(600)])
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(),
+                         601)
+
+
+class PostCardsTest(InitTests):
+    def setUp(self):
+        Post.objects.update(image='')
+        self.post.refresh_from_db()
+        self.guest_client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        cache.clear()
+
+    def render_cards(self, client):
+        response = client.get(reverse('index'))
+        return list(response.context['cards'])
+
+    def test_cards_are_rendered_per_viewer_role(self):
+        """Автор видит в карточке кнопку редактирования, гость нет."""
+        edit_url = reverse('post_edit',
+                           kwargs={'username': 'Zenon', 'post_id': 1})
+        self.assertIn(edit_url, self.render_cards(self.author_client)[0])
+        self.assertNotIn(edit_url, self.render_cards(self.guest_client)[0])
+
+    def test_cards_are_cached_until_post_changes(self):
+        """Карточки берутся из кэша, пока запись не изменится."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        posts = list(feed_posts())
+        PostCards(request, posts)[0]
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertTemplateNotUsed('posts/includes/post_item.html'):
+                card = PostCards(request, posts)[0]
+        self.assertEqual(len(queries), 0)
+        with run_on_commit():
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text='ok')
+        posts = list(feed_posts())
+        with self.assertTemplateUsed('posts/includes/post_item.html'):
+            self.assertNotEqual(PostCards(request, posts)[0], card)
+
+
+class PostImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_thumbnails_are_generated_off_the_request(self):
+        """Миниатюры и варианты для srcset создаются после сохранения,
+        а до этого карточка показывает оригинал."""
+        gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        with self.settings(MEDIA_ROOT=self.media_root):
+            post = Post.objects.create(
+                text='текст',
+                author=User.objects.create_user(username='Zenon'),
+                image=SimpleUploadedFile('thumb.gif', gif, 'image/gif'),
+            )
+            self.assertIsNone(ready_thumbnail(post, 'card'))
+            response = self.client.get(reverse('index'))
+            self.assertContains(response, post.image.url)
+
+            with run_on_commit():
+                process_post_image(post.pk)
+
+            post.refresh_from_db()
+            thumbnail = ready_thumbnail(post, 'card')
+            self.assertEqual((thumbnail['width'], thumbnail['height']),
+                             (960, 339))
+            self.assertTrue(default_storage.exists(thumbnail['name']))
+            # Never upscaled: the 2x1 original gets a single variant.
+            jpeg = image_variants(post)['formats']['jpeg']
+            self.assertEqual(
+                [(source['width'], source['height'])
+                 for source in jpeg['sources']],
+                [(2, 1)]
+            )
+            response = self.client.get(reverse('index'))
+            for source in jpeg['sources']:
+                self.assertContains(
+                    response,
+                    f'{settings.MEDIA_URL}{source["name"]} {source["width"]}w'
+                )
+
+    def create_post(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return Post.objects.create(
+            text='текст',
+            author=User.objects.get_or_create(username='Zenon')[0],
+            image=SimpleUploadedFile('image.png', buffer.getvalue(),
+                                     'image/png'),
+        )
+
+    def test_variants_are_not_upscaled(self):
+        """Варианты шире оригинала не создаются."""
+        with self.settings(MEDIA_ROOT=self.media_root):
+            post = self.create_post((1000, 400))
+            process_post_image(post.pk)
+            post.refresh_from_db()
+            for variant in image_variants(post)['formats'].values():
+                self.assertEqual(
+                    [(source['width'], source['height'])
+                     for source in variant['sources']],
+                    [(480, 170), (960, 339)]
+                )
+
+    def test_original_serves_without_variants(self):
+        """Без варианта в общем формате показывается оригинал."""
+        with self.settings(MEDIA_ROOT=self.media_root):
+            post = self.create_post((100, 40))
+        webp = {'type': 'image/webp', 'sources': [
+            {'name': 'posts/variants/1.webp', 'width': 100, 'height': 35}]}
+        for formats, sources in (({}, None), ({'webp': webp}, ['image/webp'])):
+            with self.subTest(formats=formats):
+                post.image_variants = json.dumps(
+                    {'source': post.image.name, 'formats': formats})
+                context = post_picture(post)
+                if sources is None:
+                    self.assertNotIn('fallback', context)
+                else:
+                    self.assertEqual(context['fallback'],
+                                     {'src': post.image.url})
+                    self.assertEqual(
+                        [source['type'] for source in context['sources']],
+                        sources)
+
+
+class PostImageFilesTest(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_variants_are_deleted_with_post(self):
+        """Файлы вариантов удаляются вместе с записью."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 400), 'red').save(buffer, 'PNG')
+        with self.settings(MEDIA_ROOT=self.media_root,
+                           THUMBNAIL_ASYNC=False):
+            post = Post.objects.create(
+                text='текст',
+                author=User.objects.create_user(username='Zenon'),
+                image=SimpleUploadedFile('image.png', buffer.getvalue(),
+                                         'image/png'),
+            )
+            post.refresh_from_db()
+            names = [source['name']
+                     for variant in image_variants(post)['formats'].values()
+                     for source in variant['sources']]
+            self.assertTrue(names)
+            post.delete()
+            for name in names:
+                self.assertFalse(default_storage.exists(name))
+
 
 class PaginatorViewsTest(InitTests):
     @classmethod
@@ -241,14 +586,378 @@ class PaginatorViewsTest(InitTests):
         cache.clear()
 
     def test_page_contains_count_records(self):
-        pages_counts = {
-            reverse('index'): 10,
-            reverse('index') + '?page=2': 3,
-            reverse('group', kwargs={'slug': 'test-slug'}): 10,
-            reverse('group', kwargs={'slug': 'test-slug'}) + '?page=2': 3,
-        }
-        for reverse_name, count_expected in pages_counts.items():
+        """Страницы ленты переключаются по курсору."""
+        for reverse_name in (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': 'Zenon'}),
+        ):
             with self.subTest(reverse_name=reverse_name):
-                response = self.guest_client.get(reverse_name)
-                count_post = len(response.context.get('page').object_list)
-                self.assertEqual(count_post, count_expected)
+                first_page = self.guest_client.get(reverse_name)
+                page = first_page.context.get('page')
+                self.assertEqual(len(page.object_list), 10)
+                self.assertFalse(page.has_previous())
+                response = self.guest_client.get(
+                    reverse_name, {'cursor': page.next_cursor})
+                second_page = response.context.get('page')
+                self.assertEqual(len(second_page.object_list), 3)
+                self.assertFalse(second_page.has_next())
+                response = self.guest_client.get(
+                    reverse_name, {'cursor': second_page.previous_cursor})
+                self.assertEqual(
+                    list(response.context.get('page').object_list),
+                    list(page.object_list)
+                )
+
+    def test_cursor_pages_dont_skip_posts_with_equal_date(self):
+        """Записи с одинаковой датой не теряются между страницами."""
+        Post.objects.update(pub_date=self.post.pub_date)
+        seen = []
+        cursor = None
+        while True:
+            response = self.guest_client.get(
+                reverse('index'), {'cursor': cursor} if cursor else {})
+            page = response.context.get('page')
+            seen.extend(post.id for post in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+            cache.clear()
+        self.assertEqual(sorted(seen), sorted(
+            Post.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Неверный курсор открывает первую страницу."""
+        date = '2020-01-01T00:00:00+00:00'
+        cursors = ['!!'] + [encode_cursor(NEXT, values) for values in (
+            [None, None], [{'a': 1}, 1], [[1], 1], [5, 1], [date, 2 ** 70],
+            [date, str(2 ** 70)], [date, True], [date, 1.5],
+        )]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.guest_client.get(
+                    reverse('index'), {'cursor': cursor})
+                page = response.context.get('page')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(page.object_list), 10)
+                self.assertFalse(page.has_previous())
+
+    def test_paginator_reports_approximate_total(self):
+        """Приблизительное число записей считается по запросу."""
+        paginator = CursorPaginator(Post.objects.all(), 10,
+                                    approximate_count=True)
+        self.assertEqual(paginator.page().total, Post.objects.count())
+        self.assertIsNone(
+            CursorPaginator(Post.objects.all(), 10).page().total)
+
+
+# Every request of these tests fails if it repeats a query per row.
+@override_settings(QUERY_DETECTOR_MODE='raise', QUERY_DETECTOR_SAMPLE_RATE=1)
+class FeedQueriesTest(InitTests):
+    MAX_QUERIES_PER_PAGE = 6
+
+    def setUp(self):
+        Post.objects.update(image='')
+        self.client = Client()
+        self.client.force_login(self.user)
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_feed_queries_dont_depend_on_page_size(self):
+        """Число запросов ленты не зависит от количества записей."""
+        urls = (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': 'Zenon'}),
+            reverse('follow_index'),
+            reverse('post', kwargs={'username': 'Zenon', 'post_id': 1}),
+        )
+        single_post = {url: self.count_queries(url) for url in urls}
+        for i in range(10):
+            post = Post.objects.create(
+                text=f'текст {i}', author=self.author, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text='ok')
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text='ok')
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with query_budget(self.MAX_QUERIES_PER_PAGE) as queries:
+                    self.client.get(url)
+                self.assertEqual(queries.count, single_post[url])
+
+    def test_per_row_queries_fail_the_request(self):
+        """Запрос на каждую запись ленты роняет страницу в тестах."""
+        for i in range(5):
+            Post.objects.create(text=f'текст {i}', author=self.author)
+        render = caching.render_to_string
+
+        def render_with_query(template_name, context):
+            context['post'].comments.count()
+            return render(template_name, context)
+
+        with mock.patch.object(caching, 'render_to_string',
+                               render_with_query):
+            with self.assertRaisesMessage(QueryPatternError,
+                                          'posts_comment'):
+                self.client.get(reverse('index'))
+
+    @query_budget(2)
+    def test_query_budget_as_decorator(self):
+        """Бюджет запросов можно задать декоратором теста."""
+        Post.objects.count()
+        with self.assertRaises(QueryPatternError):
+            with query_budget(0):
+                Post.objects.count()
+
+    def test_feed_shows_comment_count(self):
+        """Карточка записи показывает число комментариев."""
+        Comment.objects.create(post=self.post, author=self.user, text='ok')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['page'][0].comments_count, 1)
+        self.assertContains(response, 'Комментариев: 1')
+
+
+class ConditionalGetTest(InitTests):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 без отрисовки."""
+        urls = (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': 'Zenon'}),
+            reverse('post', kwargs={'username': 'Zenon',
+                                    'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.revalidate(self.guest_client, url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_changes_invalidate_etag(self):
+        """Новая запись, комментарий и подписка меняют ETag."""
+        index = reverse('index')
+        post = reverse('post', kwargs={'username': 'Zenon',
+                                       'post_id': self.post.pk})
+        profile = reverse('profile', kwargs={'username': 'Zenon'})
+        etags = {url: self.authorized_client.get(url)['ETag']
+                 for url in (index, post, profile)}
+        with run_on_commit():
+            Post.objects.create(text='Новая', author=self.author)
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text='ok')
+            Follow.objects.create(user=self.user, author=self.author)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follows_invalidate_follower_profile(self):
+        """Подписка и отписка меняют ETag профиля подписчика."""
+        profile = reverse('profile', kwargs={'username': 'user'})
+        changes = (
+            lambda: self.authorized_client.get(reverse(
+                'profile_follow', kwargs={'username': 'Zenon'})),
+            lambda: Follow.objects.filter(user=self.user).delete(),
+        )
+        for change in changes:
+            etag = self.guest_client.get(profile)['ETag']
+            with run_on_commit():
+                change()
+            response = self.guest_client.get(
+                profile, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer_and_cursor(self):
+        """ETag зависит от посетителя и страницы ленты."""
+        index = reverse('index')
+        guest = self.guest_client.get(index)['ETag']
+        self.assertNotEqual(self.authorized_client.get(index)['ETag'], guest)
+        self.assertNotEqual(
+            self.guest_client.get(index, {'cursor': 'x'})['ETag'], guest)
+
+    def test_cache_control(self):
+        """Ленты гостей кэшируются общими кэшами, остальные — нет."""
+        index = reverse('index')
+        guest = self.guest_client.get(index)['Cache-Control']
+        self.assertIn('public', guest)
+        self.assertIn(f's-maxage={settings.FEED_SHARED_MAX_AGE}', guest)
+        user = self.authorized_client.get(index)['Cache-Control']
+        self.assertIn('private', user)
+        self.assertIn('no-cache', user)
+
+    def test_missing_page_has_no_etag(self):
+        """Несуществующая страница не получает ETag."""
+        response = self.guest_client.get(
+            reverse('group', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CommentPagesTest(InitTests):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Ответ {i}')
+            for i in range(COMMENTS_PER_PAGE + 5))
+        self.post_url = reverse('post', kwargs={'username': 'Zenon',
+                                                'post_id': self.post.pk})
+
+    def test_post_shows_first_comment_page(self):
+        """Запись показывает первую страницу комментариев по порядку."""
+        response = self.client.get(self.post_url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text, 'Ответ 0')
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'data-fragment=')
+
+    def test_fragment_loads_next_page(self):
+        """Фрагмент догружает следующие комментарии."""
+        comments = self.client.get(self.post_url).context['comments']
+        response = self.client.get(
+            reverse('post_comments', kwargs={'username': 'Zenon',
+                                             'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        page = response.context['comments']
+        self.assertEqual([comment.text for comment in page],
+                         [f'Ответ {i}' for i in range(
+                             COMMENTS_PER_PAGE, COMMENTS_PER_PAGE + 5)])
+        self.assertNotContains(response, 'data-fragment=')
+
+    def test_fragment_of_missing_post(self):
+        """Фрагмент чужой или несуществующей записи — 404."""
+        response = self.client.get(
+            reverse('post_comments', kwargs={'username': 'user',
+                                             'post_id': self.post.pk}))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(TEMPLATES=templates_setting(cached=True))
+class TemplateCacheTest(TestCase):
+    def test_warm_compiles_all_templates(self):
+        """Прогрев компилирует все шаблоны проекта заранее."""
+        from django.template import engines
+        loader, = engines['django'].engine.template_loaders
+        loader.reset()
+        self.assertGreater(template_cache.warm(), 0)
+        for name in ('base.html', 'posts/index.html',
+                     'posts/includes/post_item.html'):
+            with self.subTest(name=name):
+                self.assertIn(name, loader.get_template_cache)
+        self.assertNotIn('admin/base.html', loader.get_template_cache)
+
+    def test_pages_render_with_cached_loader(self):
+        """Страницы отрисовываются из кэшированных шаблонов."""
+        template_cache.warm()
+        response = self.client.get(reverse('index'))
+        self.assertTemplateUsed(response, 'posts/index.html')
+
+
+class TrendingViewTest(InitTests):
+    def setUp(self):
+        cache.clear()
+
+    def test_trending_page(self):
+        """Лента популярного показывает записи в порядке рейтинга."""
+        other = Post.objects.create(text='другая', author=self.author)
+        Comment.objects.create(post=other, author=self.user, text='ok')
+        with run_on_commit():
+            rank_trending()
+        with query_budget(FeedQueriesTest.MAX_QUERIES_PER_PAGE):
+            response = Client().get(reverse('trending'))
+        self.assertEqual(list(response.context['page']), [other, self.post])
+        revalidated = Client().get(reverse('trending'),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        with run_on_commit():
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text='ok')
+        changed = Client().get(reverse('trending'),
+                               HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+
+class GroupIndexTest(InitTests):
+    def setUp(self):
+        Post.objects.update(image='')
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def group_counts(self):
+        response = self.client.get(reverse('group_index'))
+        return {item['group'].slug: item['posts_count']
+                for item in response.context['groups']}
+
+    def test_group_index(self):
+        """Список групп показывает число записей и активных авторов."""
+        with query_budget(FeedQueriesTest.MAX_QUERIES_PER_PAGE):
+            response = self.client.get(reverse('group_index'))
+        self.assertTemplateUsed(response, 'posts/groups.html')
+        first = response.context['groups'][0]
+        self.assertEqual(first['group'], self.group_mayak)
+        self.assertEqual(first['posts_count'], 0)
+        self.assertContains(response, '@Zenon</a> (1)')
+
+    def test_post_edit_moves_post_between_groups(self):
+        """Перенос записи через post_edit обновляет кэш страниц групп
+        и список групп."""
+        urls = {slug: reverse('group', kwargs={'slug': slug})
+                for slug in ('test-slug', 'mayak')}
+        self.assertContains(self.client.get(urls['test-slug']), 'post_1"')
+        self.assertNotContains(self.client.get(urls['mayak']), 'post_1"')
+        self.assertEqual(self.group_counts(), {'mayak': 0, 'test-slug': 1})
+        with run_on_commit():
+            self.client.post(
+                reverse('post_edit', kwargs={'username': 'Zenon',
+                                             'post_id': self.post.pk}),
+                {'text': 'текст', 'group': self.group_mayak.pk})
+        self.assertNotContains(self.client.get(urls['test-slug']), 'post_1"')
+        self.assertContains(self.client.get(urls['mayak']), 'post_1"')
+        self.assertEqual(self.group_counts(), {'mayak': 1, 'test-slug': 0})
+
+
+class PostEditTest(InitTests):
+    def test_edit_keeps_concurrent_changes(self):
+        """Редактирование не затирает счётчик комментариев и варианты
+        изображения, записанные в это время."""
+        client = Client()
+        client.force_login(self.author)
+        is_valid = PostForm.is_valid
+
+        def is_valid_meanwhile(form):
+            Post.objects.filter(pk=self.post.pk).update(
+                comments_count=7, image_variants='{}')
+            return is_valid(form)
+
+        with mock.patch.object(PostForm, 'is_valid', is_valid_meanwhile):
+            client.post(
+                reverse('post_edit', kwargs={'username': 'Zenon',
+                                             'post_id': self.post.pk}),
+                {'text': 'новый текст', 'group': self.group.pk})
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'новый текст')
+        self.assertEqual((post.comments_count, post.image_variants),
+                         (7, '{}'))
@@ -0,0 +1,19 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """Run the on_commit() callbacks registered within the block at its
+    end, as a commit would.
+
+    TestCase never commits, so otherwise they never run.
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    # Callbacks may register more callbacks.
+    while len(connection.run_on_commit) > start:
+        _, callback = connection.run_on_commit.pop(start)
+        callback()
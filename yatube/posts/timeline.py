@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import Follow, Post, TimelineEntry, User, UserStats
+
+# Past this many prolific authors, the rest of them are merged by a single
+# source that SQLite has to sort: a compound SELECT holds 500 at most.
+MAX_MERGED_SOURCES = 100
+
+
+def fanout_limit():
+    return settings.TIMELINE_FANOUT_LIMIT
+
+
+def is_prolific(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=fanout_limit()).exists()
+
+
+def _insert(user_id, posts):
+    """Copy the newest of the (pk, pub_date) rows into the timeline."""
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts[:settings.TIMELINE_MAX_ENTRIES]),
+        ignore_conflicts=True)
+    cap(user_id)
+
+
+def _fanned_out(**filters):
+    return Post.objects.filter(fanned_out=True, **filters).order_by(
+        '-pub_date', '-id').values_list('pk', 'pub_date')
+
+
+def fan_out(post):
+    """Push a new post into the timelines of the author's followers.
+
+    Posts of prolific authors are left to be merged on read, whatever
+    the number of followers of the author becomes later.
+    """
+    if is_prolific(post.author_id):
+        post.fanned_out = False
+        Post.objects.filter(pk=post.pk).update(fanned_out=False)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Copy the posts of a newly followed author into the timeline."""
+    backfill_many(user_id, [author_id])
+
+
+def backfill_many(user_id, author_ids):
+    """backfill() for many newly followed authors at once."""
+    _insert(user_id, _fanned_out(author_id__in=author_ids))
+
+
+def trim(user_id, author_id):
+    trim_many(user_id, [author_id])
+
+
+def trim_many(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids).delete()
+
+
+def cap(user_id):
+    """Drop the entries past the TIMELINE_MAX_ENTRIES newest ones."""
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    last = entries.order_by('-pub_date', '-post_id').values_list(
+        'pub_date', 'post_id')[
+        settings.TIMELINE_MAX_ENTRIES:settings.TIMELINE_MAX_ENTRIES + 1]
+    for pub_date, post_id in last:
+        entries.filter(Q(pub_date__lt=pub_date)
+                       | Q(pub_date=pub_date, post_id__lte=post_id)).delete()
+
+
+def cap_all():
+    """cap() every timeline grown past the limit, return how many.
+
+    Fan-out does not cap the timelines it writes to: that would cost a
+    scan per follower and post.
+    """
+    user_ids = list(TimelineEntry.objects.order_by().values(
+        'user_id').annotate(entries=Count('id')).filter(
+        entries__gt=settings.TIMELINE_MAX_ENTRIES).values_list(
+        'user_id', flat=True))
+    for user_id in user_ids:
+        cap(user_id)
+    return len(user_ids)
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Refill the timelines of the users, of everyone by default.
+
+    A single INSERT ... SELECT copies the TIMELINE_MAX_ENTRIES newest
+    fanned out posts of the followed authors, for all the users at once.
+    """
+    entries = TimelineEntry.objects.all()
+    users, params = '', [True]
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        sql, user_params = User.objects.filter(
+            pk__in=user_ids).values('pk').query.sql_with_params()
+        users = f'AND follow.user_id IN ({sql})'
+        params.extend(user_params)
+    entries.delete()
+    connection = connections[router.db_for_write(TimelineEntry)]
+    table = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table(TimelineEntry._meta.db_table)}
+                (user_id, post_id, pub_date)
+            SELECT user_id, post_id, pub_date FROM (
+                SELECT follow.user_id, post.id AS post_id, post.pub_date,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY follow.user_id
+                           ORDER BY post.pub_date DESC, post.id DESC
+                       ) AS position
+                FROM {table(Follow._meta.db_table)} follow
+                INNER JOIN {table(Post._meta.db_table)} post
+                    ON post.author_id = follow.author_id
+                WHERE post.fanned_out = %s {users}
+            ) ranked
+            WHERE position <= %s
+        """, params + [settings.TIMELINE_MAX_ENTRIES])
+
+
+def timeline_sources(user):
+    """Sources of the user's follow feed, for CursorPaginator.
+
+    The materialized timeline, and the posts of each followed author
+    that were merged on read rather than fanned out.
+    """
+    merged = Follow.objects.filter(user=user).annotate(merged=Exists(
+        Post.objects.filter(author_id=OuterRef('author_id'),
+                            fanned_out=False))).filter(merged=True)
+    author_ids = list(merged.values_list('author_id', flat=True))
+    sources = [(TimelineEntry.objects.filter(user=user), {'id': 'post_id'})]
+    sources.extend(
+        (Post.objects.filter(author_id=pk, fanned_out=False), {})
+        for pk in author_ids[:MAX_MERGED_SOURCES])
+    if author_ids[MAX_MERGED_SOURCES:]:
+        sources.append((Post.objects.filter(
+            author_id__in=author_ids[MAX_MERGED_SOURCES:],
+            fanned_out=False), {}))
+    return sources
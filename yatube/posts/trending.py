@@ -0,0 +1,70 @@
+import heapq
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from . import caching
+from .feeds import feed_posts
+from .models import Comment, Post, TrendingPost
+
+TRENDING_ORDERING = ('rank',)
+
+
+def score(recent_comments, followers, age_hours):
+    """Comment velocity and reach of the author, decaying with age."""
+    activity = recent_comments + math.log1p(followers)
+    return activity / (age_hours + 2) ** settings.TRENDING_GRAVITY
+
+
+def _candidates(now, full):
+    oldest = now - timedelta(hours=settings.TRENDING_MAX_AGE_HOURS)
+    posts = Post.objects.filter(pub_date__gte=oldest)
+    last_run = TrendingPost.objects.aggregate(last=Max('ranked_at'))['last']
+    if full or last_run is None:
+        return posts
+    # Posts without news since the last run can only lose score, they
+    # rarely climb into the list. A full run now and then catches them.
+    return posts.filter(
+        Q(trending__isnull=False)
+        | Q(pub_date__gte=last_run)
+        | Q(pk__in=Comment.objects.filter(
+            created__gte=last_run).values('post_id'))
+    )
+
+
+def rank(full=False, now=None):
+    """Rescore the candidates and store the top TRENDING_SIZE posts."""
+    now = now or timezone.now()
+    since = now - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+    recent = dict(
+        Comment.objects.filter(created__gte=since).order_by()
+        .values('post_id').annotate(count=Count('id'))
+        .values_list('post_id', 'count')
+    )
+    rows = _candidates(now, full).order_by().values_list(
+        'pk', 'pub_date', 'author__stats__followers_count')
+    scored = (
+        (score(recent.get(pk, 0), followers or 0,
+               (now - pub_date).total_seconds() / 3600), pk)
+        for pk, pub_date, followers in rows.iterator()
+    )
+    top = heapq.nlargest(settings.TRENDING_SIZE, scored)
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(
+            TrendingPost(post_id=pk, rank=position, score=value,
+                         recent_comments=recent.get(pk, 0), ranked_at=now)
+            for position, (value, pk) in enumerate(top, 1)
+        )
+    caching.bump(caching.TRENDING)
+    return len(top)
+
+
+def trending_posts():
+    """Ranked posts, paginate them with TRENDING_ORDERING."""
+    return feed_posts(trending__isnull=False).annotate(
+        rank=F('trending__rank'))
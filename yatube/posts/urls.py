@@ -1,13 +1,29 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('groups/', views.group_index, name='group_index'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
+    path('trending/', views.trending, name='trending'),
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/groups/', api.groups, name='api_groups'),
+    path('api/groups/<slug:slug>/posts/', api.group_posts,
+         name='api_group_posts'),
+    path('api/users/<str:username>/posts/', api.profile_posts,
+         name='api_profile_posts'),
+    path('api/follow/', api.follow_posts, name='api_follow'),
+    path('api/follow/authors/', api.follow_authors,
+         name='api_follow_authors'),
+    path('api/follow/suggestions/', api.follow_suggestions,
+         name='api_follow_suggestions'),
+    path('api/comments/', api.add_comments, name='api_comments'),
     path('<str:username>/follow/', views.profile_follow,
          name='profile_follow'),
     path('<str:username>/unfollow/', views.profile_unfollow,
@@ -18,4 +34,6 @@ urlpatterns = [
          name='post_edit'),
     path('<str:username>/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
 ]
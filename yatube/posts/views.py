@@ -1,70 +1,162 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404
 from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.functional import SimpleLazyObject
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from yatube.routers import pin_to_primary, read_from_replica
+from yatube.sqlite import serialized_write
 
+from . import follow_graph
+from .caching import (GROUP_INDEX, FeedCache, PostCards, conditional_feed,
+                      post_version)
+from .counters import group_summaries, user_stats
+from .feeds import feed_posts
+from .forms import CommentForm, PostForm, SearchForm
+from .models import Group, Post, User
+from .paginator import (COMMENT_ORDERING, COMMENTS_PER_PAGE, GROUP_ORDERING,
+                        GROUPS_PER_PAGE, paginate)
+from .search import SEARCH_ORDERING, search_posts
+from .timeline import timeline_sources
+from .trending import TRENDING_ORDERING, trending_posts
+
+
+def post_comment_page(request, post):
+    return paginate(request, post.comments.select_related('author'),
+                    per_page=COMMENTS_PER_PAGE, ordering=COMMENT_ORDERING)
+
+
+def index_feeds():
+    return ['index']
+
+
+def trending_feeds():
+    return ['trending']
+
+
+def group_index_feeds():
+    return [GROUP_INDEX]
 
-def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
 
-    page_number = request.GET.get('page')
+def group_feeds(slug):
+    pk = Group.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    return None if pk is None else [f'group:{pk}']
 
-    page = paginator.get_page(page_number)
+
+def profile_feeds(username):
+    pk = User.objects.filter(
+        username=username).values_list('pk', flat=True).first()
+    return None if pk is None else [f'profile:{pk}']
+
+
+def post_view_feeds(username, post_id):
+    authors = Post.objects.filter(
+        pk=post_id, author__username=username,
+    ).order_by().values_list('author_id', flat=True)[:1]
+    if not authors:
+        return None
+    return [post_version(post_id), f'profile:{authors[0]}']
+
+
+@read_from_replica
+@conditional_feed(index_feeds)
+def index(request):
+    page = paginate(request, feed_posts())
     return render(
         request,
         'posts/index.html',
-        {'page': page, }
+        {
+            'page': page,
+            'cards': PostCards(request, page),
+            'feed_cache': FeedCache(request, 'index'),
+        }
     )
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
+@read_from_replica
+@conditional_feed(trending_feeds)
+def trending(request):
+    page = paginate(request, trending_posts(), ordering=TRENDING_ORDERING)
+    return render(
+        request,
+        'posts/trending.html',
+        {
+            'page': page,
+            'cards': PostCards(request, page),
+            'feed_cache': FeedCache(request, 'trending'),
+        }
+    )
+
 
-    page_number = request.GET.get('page')
+def group_page(request):
+    return paginate(request, Group.objects.select_related('stats'),
+                    per_page=GROUPS_PER_PAGE, ordering=GROUP_ORDERING)
 
-    page = paginator.get_page(page_number)
+
+@read_from_replica
+@conditional_feed(group_index_feeds)
+def group_index(request):
+    page = group_page(request)
+    return render(
+        request,
+        'posts/groups.html',
+        {
+            'page': page,
+            # Read only if the page is not in the cache.
+            'groups': SimpleLazyObject(lambda: group_summaries(page)),
+            'feed_cache': FeedCache(request, GROUP_INDEX),
+        }
+    )
+
+
+@read_from_replica
+@conditional_feed(group_feeds)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    page = paginate(request, feed_posts(group=group))
     return render(
         request,
         'posts/group.html',
         {
             'page': page,
+            'cards': PostCards(request, page),
             'group': group,
+            'feed_cache': FeedCache(request, f'group:{group.pk}'),
         }
     )
 
 
+@read_from_replica
+@conditional_feed(profile_feeds)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    page = paginate(request, feed_posts(author=author))
 
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-
-    following = (request.user.is_authenticated
-                 and author.following.filter(user=request.user).exists())
+    following = follow_graph.is_following(
+        request.user, [author.pk])[author.pk]
 
     return render(
         request,
         'posts/profile.html',
         {
             'page': page,
+            'cards': PostCards(request, page),
             'author': author,
+            'stats': user_stats(author),
             'following': following,
+            'feed_cache': FeedCache(request, f'profile:{author.pk}'),
         }
     )
 
 
+@read_from_replica
+@conditional_feed(post_view_feeds)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
-    following = (request.user.is_authenticated
-                 and post.author.following.filter(user=request.user).exists())
-    comments = post.comments.all()
+    post = get_object_or_404(feed_posts().select_related('author__stats'),
+                             pk=post_id, author__username=username)
+    following = follow_graph.is_following(
+        request.user, [post.author_id])[post.author_id]
+    comments = post_comment_page(request, post)
     form = CommentForm()
 
     return render(
@@ -73,6 +165,7 @@ def post_view(request, username, post_id):
         {
             'post': post,
             'author': post.author,
+            'stats': user_stats(post.author),
             'comments': comments,
             'form': form,
             'following': following,
@@ -81,7 +174,22 @@ def post_view(request, username, post_id):
     )
 
 
+@read_from_replica
+@conditional_feed(post_view_feeds)
+def post_comments(request, username, post_id):
+    """Further comments of a post, loaded by the "load more" link."""
+    post = get_object_or_404(
+        Post.objects.select_related('author').only('id', 'author__username'),
+        pk=post_id, author__username=username)
+    return render(
+        request,
+        'posts/includes/comment_list.html',
+        {'post': post, 'comments': post_comment_page(request, post)}
+    )
+
+
 @login_required
+@pin_to_primary
 def add_comment(request, username, post_id):
 
     form = CommentForm(request.POST or None)
@@ -92,7 +200,7 @@ def add_comment(request, username, post_id):
             comment = form.save(commit=False)
             comment.author = request.user
             comment.post = post
-            comment.save()
+            serialized_write(comment.save)
 
             return redirect('post', username, post_id)
 
@@ -104,6 +212,7 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@pin_to_primary
 def new_post(request):
 
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -112,7 +221,7 @@ def new_post(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            serialized_write(post.save)
 
             return redirect('index')
 
@@ -124,6 +233,7 @@ def new_post(request):
 
 
 @login_required
+@pin_to_primary
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, pk=post_id, author__username=username)
 
@@ -136,7 +246,10 @@ def post_edit(request, username, post_id):
 
     if request.method == 'POST':
         if form.is_valid():
-            form.save()
+            post = form.save(commit=False)
+            # Counters and image variants are written concurrently by
+            # signals and the image pool, keep them out of the UPDATE.
+            serialized_write(post.save, update_fields=form._meta.fields)
             return redirect('post', username=username, post_id=post_id)
 
     return render(
@@ -152,37 +265,65 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@read_from_replica
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = paginate(request, feed_posts(),
+                    sources=timeline_sources(request.user))
 
     return render(
         request,
         'posts/follow.html',
-        {'page': page, }
+        {
+            'page': page,
+            'cards': PostCards(request, page),
+        }
+    )
+
+
+@read_from_replica
+def search(request):
+    form = SearchForm(request.GET or None)
+    page = None
+
+    if form.is_valid():
+        filters = {}
+        if form.cleaned_data['group']:
+            filters['group__slug'] = form.cleaned_data['group']
+        if form.cleaned_data['author']:
+            filters['author__username'] = form.cleaned_data['author']
+        posts = search_posts(form.cleaned_data['q'], **filters)
+        page = paginate(request, posts, ordering=SEARCH_ORDERING)
+
+    query = request.GET.copy()
+    query.pop('cursor', None)
+
+    return render(
+        request,
+        'posts/search.html',
+        {
+            'form': form,
+            'page': page,
+            'cards': PostCards(request, page or []),
+            'query_string': query.urlencode(),
+        }
     )
 
 
 @login_required
+@pin_to_primary
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if (request.user == author):
-        return redirect('profile', username)
-    Follow.objects.get_or_create(
-        user=request.user,
-        author=author,
-    )
+    serialized_write(follow_graph.follow_many, request.user, [author.pk])
     return redirect('profile', username)
 
 
 @login_required
+@pin_to_primary
 def profile_unfollow(request, username):
-    follow = get_object_or_404(Follow, user=request.user,
-                               author__username=username)
-    follow.delete()
+    author = get_object_or_404(User, username=username)
+    if not serialized_write(follow_graph.unfollow_many, request.user,
+                            [author.pk]):
+        raise Http404
     return redirect('profile', username)
 
 
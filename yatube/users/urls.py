@@ -1,7 +1,9 @@
 from django.urls import path
 
+from yatube.routers import pin_to_primary
+
 from . import views
 
 urlpatterns = [
-    path('signup/', views.SignUp.as_view(), name='signup'),
+    path('signup/', pin_to_primary(views.SignUp.as_view()), name='signup'),
 ]
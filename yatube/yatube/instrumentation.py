@@ -0,0 +1,238 @@
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_lock = threading.Lock()
+
+TIME_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_histograms = {}
+_counters = defaultdict(int)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, buckets=TIME_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        _histograms[key].observe(value)
+
+
+def increment(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class Recorder:
+    """Measurements of a single sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.render_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timers = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+
+def current():
+    """Recorder of the request being sampled in this thread, if any."""
+    return getattr(_state, 'recorder', None)
+
+
+def record_cache(hits, misses):
+    recorder = current()
+    if recorder is not None:
+        recorder.cache_hits += hits
+        recorder.cache_misses += misses
+
+
+@contextmanager
+def timer(name):
+    """Time a block, in the current request and in a histogram.
+
+    Unlike request metrics, these are recorded for every call, also
+    outside of requests, as in the thumbnail pool.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(f'{name}_ms', elapsed * 1000)
+        recorder = current()
+        if recorder is not None:
+            recorder.timers[name] += elapsed
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context=None, request=None):
+        recorder = current()
+        if recorder is None:
+            return render(self, context, request)
+        # Templates rendered by templates are part of the outer render.
+        recorder.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            recorder.render_depth -= 1
+            if not recorder.render_depth:
+                recorder.render += time.perf_counter() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+def install_template_timing():
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+
+
+def server_timing(recorder, total):
+    metrics = [
+        f'db;dur={recorder.db * 1000:.1f};desc="{recorder.queries} queries"',
+        f'tpl;dur={recorder.render * 1000:.1f}',
+        f'cache;desc="{recorder.cache_hits} hits, '
+        f'{recorder.cache_misses} misses"',
+    ]
+    metrics.extend(f'{name};dur={elapsed * 1000:.1f}'
+                   for name, elapsed in recorder.timers.items())
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class InstrumentationMiddleware:
+    """Measure a sample of requests.
+
+    A sampled request gets a Server-Timing header, is written to the log
+    and aggregated into the histograms served by metrics(). Requests out
+    of the sample only pay for a random number.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timing()
+
+    def __call__(self, request):
+        if random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = _state.recorder = Recorder()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _state.recorder = None
+        total = time.perf_counter() - started
+        self.record(request, response, recorder, total)
+        response['Server-Timing'] = server_timing(recorder, total)
+        return response
+
+    def record(self, request, response, recorder, total):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        observe('request_ms', total * 1000, view=view)
+        observe('db_ms', recorder.db * 1000, view=view)
+        observe('render_ms', recorder.render * 1000, view=view)
+        observe('queries', recorder.queries, COUNT_BUCKETS, view=view)
+        increment('cache_hits_total', recorder.cache_hits, view=view)
+        increment('cache_misses_total', recorder.cache_misses, view=view)
+        logger.info(json.dumps({
+            'view': view,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(recorder.db * 1000, 1),
+            'queries': recorder.queries,
+            'render_ms': round(recorder.render * 1000, 1),
+            'cache_hits': recorder.cache_hits,
+            'cache_misses': recorder.cache_misses,
+            **{f'{name}_ms': round(elapsed * 1000, 1)
+               for name, elapsed in recorder.timers.items()},
+        }))
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"'
+                          for name, value in labels.items()) + '}'
+
+
+def exposition():
+    """Metrics of this process in the Prometheus text format."""
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    for (name, labels), histogram in histograms:
+        name = f'yatube_{name}'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',),
+                                histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} '
+                         f'{cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum:g}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+    for (name, labels), value in counters:
+        lines.append(f'yatube_{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(exposition(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,154 @@
+import logging
+import random
+import re
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import ContextDecorator, ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDERS_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+SPACE_RE = re.compile(r'\s+')
+# Transaction control repeats by design.
+IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryPatternError(AssertionError):
+    pass
+
+
+def normalize(sql):
+    """The query with its literals replaced, the same for every row."""
+    sql = STRING_RE.sub('?', sql).replace('%s', '?')
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDERS_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def _origin():
+    # The innermost frame of the project's own code.
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(settings.BASE_DIR)
+                and frame.filename != __file__
+                and 'site-packages' not in frame.filename):
+            return f'{frame.filename}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryTracker:
+    """Group the queries of all connections by their normalized SQL."""
+
+    def __init__(self, repeat_threshold=None):
+        self.repeat_threshold = (repeat_threshold
+                                 or settings.QUERY_REPEAT_THRESHOLD)
+        self.count = 0
+        self.patterns = Counter()
+        self.durations = defaultdict(float)
+        self.origins = {}
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(sql, time.perf_counter() - started)
+
+    def add(self, sql, elapsed):
+        if sql.startswith(IGNORED):
+            return
+        self.count += 1
+        pattern = normalize(sql)
+        self.patterns[pattern] += 1
+        self.durations[pattern] += elapsed
+        # The stack is only worth its cost once a pattern repeats.
+        if self.patterns[pattern] == self.repeat_threshold:
+            self.origins[pattern] = _origin()
+        if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            self.slow.append((elapsed, pattern))
+
+    @contextmanager
+    def track(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self):
+        """Queries run once per row instead of once per page."""
+        return [
+            f'{count}x {pattern} ({self.origins[pattern]})'
+            for pattern, count in self.patterns.most_common()
+            if count >= self.repeat_threshold
+        ]
+
+    def slow_queries(self):
+        return [f'{elapsed * 1000:.0f} ms {pattern}'
+                for elapsed, pattern in self.slow]
+
+
+class QueryDetectorMiddleware:
+    """Look for repeated and slow queries in a sample of requests.
+
+    In "log" mode both are logged, in "raise" mode repeated queries fail
+    the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_DETECTOR_MODE
+        if (mode == 'off' or random.random()
+                >= settings.QUERY_DETECTOR_SAMPLE_RATE):
+            return self.get_response(request)
+        tracker = QueryTracker()
+        with tracker.track():
+            response = self.get_response(request)
+        for query in tracker.slow_queries():
+            logger.warning('Slow query on %s: %s', request.path, query)
+        repeated = tracker.repeated()
+        if repeated and mode == 'raise':
+            raise QueryPatternError(
+                f'Repeated queries on {request.path}: ' + '; '.join(repeated))
+        for query in repeated:
+            logger.warning('Repeated query on %s: %s', request.path, query)
+        return response
+
+
+class query_budget(ContextDecorator):
+    """Fail if the block runs more queries than budgeted or repeats any.
+
+        with query_budget(5):
+            self.client.get(url)
+    """
+
+    def __init__(self, max_queries, repeat_threshold=None):
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold
+
+    def __enter__(self):
+        self.tracker = QueryTracker(self.repeat_threshold)
+        self._tracking = self.tracker.track()
+        self._tracking.__enter__()
+        return self.tracker
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._tracking.__exit__(exc_type, exc_value, tb)
+        if exc_type is not None:
+            return False
+        problems = self.tracker.repeated()
+        if self.tracker.count > self.max_queries:
+            problems.insert(0, f'{self.tracker.count} queries, budget is '
+                               f'{self.max_queries}')
+        if problems:
+            queries = [f'{count}x {pattern}' for pattern, count
+                       in self.tracker.patterns.most_common()]
+            raise QueryPatternError('\n'.join(problems + queries))
+        return False
@@ -0,0 +1,80 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads made inside the block to one of the replicas."""
+    previous = getattr(_state, 'replica', None)
+    replicas = settings.DATABASE_REPLICAS
+    _state.replica = random.choice(replicas) if replicas else None
+    try:
+        yield _state.replica
+    finally:
+        _state.replica = previous
+
+
+def is_pinned(request):
+    try:
+        until = float(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+def read_from_replica(view):
+    """Serve a read-only view from a replica.
+
+    Clients that have written recently keep reading from the primary, so
+    they see their own changes before replication catches up.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if is_pinned(request):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def pin_to_primary(view):
+    """Mark the client of a writing view as one that must read from the
+    primary for the next REPLICA_STICKY_SECONDS."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        # Successful writes redirect, or answer 201 Created in the API.
+        if response.status_code in (201, 301, 302):
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE,
+                                str(time.time() + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica is None:
+            return None
+        if model._meta.app_label in settings.REPLICA_EXCLUDED_APPS:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
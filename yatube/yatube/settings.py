@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -31,6 +32,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.instrumentation.InstrumentationMiddleware',
+    'yatube.queries.QueryDetectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -44,12 +47,26 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
+# Production template mode: templates are compiled once per process by the
+# cached loader, and wsgi.py compiles all of them at startup (see
+# yatube.template_cache). On by default without DEBUG; with DEBUG templates
+# are read from disk on every render so edits show up at once.
+TEMPLATE_CACHING = (not DEBUG
+                    or os.environ.get('YATUBE_TEMPLATE_CACHE', '') == '1')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': (
+                [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+                if TEMPLATE_CACHING else TEMPLATE_LOADERS
+            ),
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -62,13 +79,55 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Seconds to keep connections open between requests, 0 closes them at the
+# end of every request and None keeps them forever.
+DB_CONN_MAX_AGE = os.environ.get('YATUBE_DB_CONN_MAX_AGE', '0')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': (None if DB_CONN_MAX_AGE == 'none'
+                         else int(DB_CONN_MAX_AGE)),
     }
 }
 
+# Production mode for SQLite: write-ahead log, so readers never wait for
+# the writer, memory-mapped reads and a busy timeout, and the writes of
+# views queued one at a time (see yatube.sqlite).
+SQLITE_TUNING = os.environ.get('YATUBE_SQLITE_TUNING', '') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # With WAL, NORMAL only risks the last transactions on power loss.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are in KiB.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+SQLITE_WRITE_RETRIES = 5
+SQLITE_WRITE_BACKOFF = 0.05
+
+# Read replicas, as a comma separated list of SQLite files for local use
+# (see the sync_replicas command). Read-only feed views read from a random
+# replica unless the client has written recently.
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+        filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')),
+        start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(DATABASES['default'], NAME=path,
+                            TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+# Sessions and users are read from the primary: request.user is resolved
+# lazily, and a user who has just signed up is not on the replicas yet.
+REPLICA_EXCLUDED_APPS = ('sessions', 'auth')
+REPLICA_STICKY_COOKIE = 'primary_until'
+REPLICA_STICKY_SECONDS = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -84,16 +143,113 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The cache is configured from the environment. YATUBE_CACHE_BACKEND is
+# either one of the aliases below or a dotted path to a backend class;
+# "file" is shared by all worker processes on the host, memcached by all
+# hosts. Bump YATUBE_CACHE_VERSION to drop every cached value at once.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'pylibmc': 'django.core.cache.backends.memcached.PyLibMCCache',
+    'database': 'django.core.cache.backends.db.DatabaseCache',
+}
+CACHE_LOCATIONS = {
+    'file': os.path.join(tempfile.gettempdir(), 'yatube-cache'),
+    'memcached': '127.0.0.1:11211',
+    'pylibmc': '127.0.0.1:11211',
+    'database': 'yatube_cache',
+}
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE_BACKEND', 'locmem')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION',
+                                   CACHE_LOCATIONS.get(CACHE_BACKEND, '')),
+        'KEY_PREFIX': os.environ.get('YATUBE_CACHE_KEY_PREFIX', 'yatube'),
+        'VERSION': int(os.environ.get('YATUBE_CACHE_VERSION', 1)),
+        'TIMEOUT': int(os.environ.get('YATUBE_CACHE_TIMEOUT', 300)),
     }
 }
 
+# Rendered feed pages are invalidated on change, so they may live long.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Largest number of comments accepted by a single batch API request.
+COMMENT_BATCH_SIZE = 100
+
+# Feed pages carry an ETag and are revalidated on every visit. Shared
+# caches (a CDN or a reverse proxy) may serve them to anonymous visitors
+# for this many seconds without asking.
+FEED_SHARED_MAX_AGE = 30
+
+# Authors with more followers are not fanned out on write: their posts are
+# merged into the follow feed at read time instead. Timelines keep the
+# newest TIMELINE_MAX_ENTRIES posts, fan-out adds to them until the
+# trim_timelines command cuts them back.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_MAX_ENTRIES = 1000
+
+# Seconds to cache the sets of followed and following user ids (see
+# posts.follow_graph), they are also dropped on every follow change.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60
+# Most authors followed or unfollowed by a single API request.
+FOLLOW_BATCH_SIZE = 100
+
+# The trending feed (see posts.trending) keeps the TRENDING_SIZE best posts
+# of the last TRENDING_MAX_AGE_HOURS, scored by their comments over the
+# last TRENDING_WINDOW_HOURS and their author's followers, decaying with
+# age at TRENDING_GRAVITY. The rank_trending command refreshes it.
+TRENDING_SIZE = 100
+TRENDING_WINDOW_HOURS = 24
+TRENDING_MAX_AGE_HOURS = 24 * 7
+TRENDING_GRAVITY = 1.5
+
+# Thumbnails of post images, generated in the background on upload. The
+# templates only ever show thumbnails that are ready.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+
+# Responsive variants of post images for srcset, cropped to the card
+# aspect ratio. Formats the installed Pillow cannot write are skipped;
+# the last one is the fallback for browsers without <picture> support.
+POST_IMAGE_ASPECT = (960, 339)
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FORMATS = ('avif', 'webp', 'jpeg')
+POST_IMAGE_QUALITY = 80
+
+# Uploaded images are checked from their headers: anything above the pixel
+# limit is refused before decoding, larger originals are downscaled to
+# POST_IMAGE_MAX_DIMENSION before they are stored.
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_DIMENSION = 2560
+POST_IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Share of requests measured by yatube.instrumentation: they get a
+# Server-Timing header, are logged to "yatube.instrumentation" and are
+# aggregated into histograms served at /metrics/ to METRICS_ALLOWED_IPS.
+INSTRUMENTATION_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_INSTRUMENTATION_SAMPLE_RATE', 0.01))
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+
+# yatube.queries looks for queries repeated once per row and slow queries
+# in a sample of requests and logs them. In "raise" mode it fails the
+# requests that repeat a query.
+QUERY_DETECTOR_MODE = os.environ.get('YATUBE_QUERY_DETECTOR', 'log')
+QUERY_DETECTOR_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_QUERY_DETECTOR_SAMPLE_RATE', 0.01))
+QUERY_REPEAT_THRESHOLD = 5
+SLOW_QUERY_MS = 200
+
 LANGUAGE_CODE = 'ru'
 
 TIME_ZONE = 'UTC'
@@ -0,0 +1,61 @@
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+_write_lock = threading.Lock()
+
+LOCKED_ERRORS = ('database is locked', 'database table is locked')
+
+
+def pragma_statements():
+    return [f'PRAGMA {name} = {value}'
+            for name, value in settings.SQLITE_PRAGMAS.items()]
+
+
+def tune_connection(sender, connection, **kwargs):
+    """Apply the production pragmas to every new SQLite connection."""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements():
+            cursor.execute(statement)
+
+
+def is_locked_error(error):
+    return str(error).startswith(LOCKED_ERRORS)
+
+
+def run_serialized(func, *args, **kwargs):
+    """Run a writing function one at a time within the process.
+
+    SQLite has a single writer: queueing the writers of this process on a
+    lock is cheaper than letting them fight over the database lock. Writers
+    of other processes still can hold it, so a locked database is retried
+    with a jittered exponential backoff.
+    """
+    attempts = settings.SQLITE_WRITE_RETRIES
+    delay = settings.SQLITE_WRITE_BACKOFF
+    for attempt in range(attempts + 1):
+        try:
+            with _write_lock:
+                return func(*args, **kwargs)
+        except (OperationalError, sqlite3.OperationalError) as error:
+            if not is_locked_error(error) or attempt == attempts:
+                raise
+        time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def serialized_write(func, *args, **kwargs):
+    """Run the writes of a view in a transaction through run_serialized().
+
+    Only the writes queue on the lock: the view validates the form and
+    renders the response outside of it. Calls func directly unless
+    SQLITE_TUNING is on.
+    """
+    if not settings.SQLITE_TUNING:
+        return func(*args, **kwargs)
+    return run_serialized(transaction.atomic()(func), *args, **kwargs)
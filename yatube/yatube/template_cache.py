@@ -0,0 +1,68 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.template import TemplateSyntaxError, engines
+
+logger = logging.getLogger(__name__)
+
+
+def templates_setting(cached):
+    """TEMPLATES with or without the cached loader."""
+    loaders = settings.TEMPLATE_LOADERS
+    if cached:
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+    template, = settings.TEMPLATES
+    return [{**template,
+             'OPTIONS': {**template['OPTIONS'], 'loaders': loaders}}]
+
+
+def _project_dir(directory):
+    project = os.path.abspath(settings.BASE_DIR)
+    return os.path.commonpath([project, os.path.abspath(directory)]) == project
+
+
+def template_names(engine):
+    """Names of the project's templates the engine's loaders can find.
+
+    Templates of installed packages, such as the admin, are left out:
+    the site rarely renders them.
+    """
+    names = {}
+    for loader in engine.template_loaders:
+        # The cached loader wraps the loaders that read the files.
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in filter(_project_dir, inner.get_dirs()):
+                for root, _, files in os.walk(directory):
+                    for filename in files:
+                        path = os.path.join(root, filename)
+                        name = os.path.relpath(path, directory)
+                        names.setdefault(name.replace(os.sep, '/'), path)
+    return sorted(names)
+
+
+def warm():
+    """Compile the project's templates into the cached loaders, return
+    how many.
+
+    Without it, the first request to each page pays for reading and
+    parsing all the templates it extends and includes. Templates that
+    fail to compile are left to fail when rendered.
+    """
+    started = time.perf_counter()
+    warmed = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as error:
+                logger.debug('Template %s not warmed: %s', name, error)
+            else:
+                warmed += 1
+    logger.info('Warmed %d templates in %.0f ms', warmed,
+                (time.perf_counter() - started) * 1000)
+    return warmed
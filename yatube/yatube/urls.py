@@ -1,14 +1,22 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
+from django.contrib.auth import views as auth_views
 from django.urls import include, path
 from django.conf.urls import handler404, handler500
 
+from yatube import instrumentation
+from yatube.routers import pin_to_primary
+
 urlpatterns = [
     path('auth/', include('users.urls')),
+    # A fresh login reads its own session and user from the primary.
+    path('auth/login/', pin_to_primary(auth_views.LoginView.as_view()),
+         name='login'),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', instrumentation.metrics, name='metrics'),
     path('', include('posts.urls')),
 ]
 